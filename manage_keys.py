@@ -11,17 +11,26 @@ limit_reset values: daily, weekly, monthly, or empty (no reset).
 """
 
 import csv
+import heapq
 import json
+import math
 import os
 import re
 import sqlite3
 import sys
+import threading
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
+from itertools import chain, islice
+from operator import itemgetter
 from pathlib import Path
 
 import requests
 import rich_click as click
+from requests.adapters import HTTPAdapter
 from rich.console import Console
 from rich.panel import Panel
 from rich.progress import (
@@ -32,6 +41,15 @@ from rich.progress import (
     TextColumn,
 )
 from rich.table import Table
+from urllib3.util.retry import Retry
+
+try:  # optional: orjson encodes and decodes large key lists several times faster
+    import orjson
+except ImportError:
+    orjson = None
+
+_json_loads = orjson.loads if orjson else json.loads
+_json_dumps = orjson.dumps if orjson else lambda obj: json.dumps(obj).encode()
 
 # Configure rich-click
 click.rich_click.USE_MARKDOWN = True
@@ -44,22 +62,217 @@ console = Console()
 
 PLACEHOLDER_DOMAIN = "@FIXME.mq.edu.au"
 VALID_LIMIT_RESETS = {"daily", "weekly", "monthly"}
-SCHEMA_VERSION = 2
+# Spellings of a true target_disabled accepted in limits.csv, once stripped
+# and lowercased
+TRUTHY_VALUES = frozenset({"true", "1", "yes"})
+ROSTER_FIELDS = ("first_name", "last_name", "email", "mq_id", "budget", "limit_reset")
+# Roster columns that must be non-blank on every row
+REQUIRED_ROSTER_FIELDS = ("first_name", "last_name", "mq_id")
+SCHEMA_VERSION = 3
+WRITE_BUFFER_SIZE = 1 << 20  # 1 MiB: one write() per MiB of CSV output
+
+# Key names: YYYYMMDD_FirstName LastName_MQID, or YYYYMMDD_Name for legacy keys.
+# One pattern covers both: groups are (date, name, mq_id, None) for the first
+# form and (date, None, None, name) for the legacy form.
+_KEY_NAME_RE = re.compile(r"^(\d{8})_(?:(.+)_(\w+)|(.+))$")
+
+# Concurrency for bulk API calls: at most API_MAX_WORKERS requests in flight,
+# started no faster than API_RATE_LIMIT per second.
+API_MAX_WORKERS = 4
+API_RATE_LIMIT = 4.0
+# Retries per request after a 429, and the longest Retry-After we will honour
+API_MAX_RETRIES = 3
+API_MAX_RETRY_AFTER = 60.0
+# Pause all callers when X-RateLimit-Remaining drops to this many requests
+API_RATELIMIT_LOW_WATER = 2
+# Default for update_openrouter_key's `limit`, which leaves the limit alone;
+# limit=None instead sends null, removing the limit
+_UNCHANGED = object()
+
+# Shared by every command that records changes, so each writes the same
+# statement text and reuses one prepared statement from sqlite3's cache.
+INSERT_CHANGELOG_SQL = (
+    "INSERT INTO changelog (key_hash, action, old_value, new_value, changed_at) VALUES (?, ?, ?, ?, ?)"
+)
+
+# Tables of the current schema, created by init-db in one transaction
+_SCHEMA_TABLES = (
+    """CREATE TABLE IF NOT EXISTS student
+                     (email TEXT PRIMARY KEY,
+                      first_name TEXT NOT NULL,
+                      last_name TEXT NOT NULL,
+                      mq_id TEXT NOT NULL UNIQUE,
+                      created_at TIMESTAMP)""",
+    """CREATE TABLE IF NOT EXISTS key
+                     (key_hash TEXT PRIMARY KEY,
+                      key_label TEXT NOT NULL,
+                      email TEXT NOT NULL,
+                      key_name TEXT NOT NULL,
+                      created_at TIMESTAMP,
+                      credit_limit REAL,
+                      disabled BOOLEAN,
+                      FOREIGN KEY(email) REFERENCES student(email))""",
+    """CREATE TABLE IF NOT EXISTS usage
+                     (id INTEGER PRIMARY KEY,
+                      key_hash TEXT NOT NULL,
+                      usage REAL,
+                      checked_at TIMESTAMP NOT NULL,
+                      FOREIGN KEY(key_hash) REFERENCES key(key_hash))""",
+    """CREATE TABLE IF NOT EXISTS changelog
+                     (id INTEGER PRIMARY KEY,
+                      key_hash TEXT NOT NULL,
+                      action TEXT NOT NULL,
+                      old_value TEXT,
+                      new_value TEXT,
+                      changed_at TIMESTAMP NOT NULL,
+                      FOREIGN KEY(key_hash) REFERENCES key(key_hash))""",
+    "CREATE TABLE schema_version (version INTEGER NOT NULL)",
+)
+
+# Secondary indexes for per-student and per-key history lookups (added in v3)
+_SCHEMA_INDEXES = (
+    "CREATE INDEX IF NOT EXISTS idx_key_email ON key(email)",
+    "CREATE INDEX IF NOT EXISTS idx_usage_key_hash_checked ON usage(key_hash, checked_at DESC)",
+    "CREATE INDEX IF NOT EXISTS idx_changelog_key_hash ON changelog(key_hash, changed_at DESC)",
+)
+
+# Statements upgrading a database from schema version N to N + 1, keyed by N.
+# Versions without an entry here cannot be migrated in place.
+_SCHEMA_MIGRATIONS = {
+    2: _SCHEMA_INDEXES,
+}
+
+# export-keys output columns, in file order
+EXPORT_KEYS_FIELDS = ("first_name", "last_name", "email", "mq_id", "api_key", "key_name", "limit", "disabled")
+# export-keys --format choices and the file extension of each
+EXPORT_FORMATS = {"csv": "csv", "json": "json", "json-columns": "json", "arrow": "arrow"}
+MISSING_API_KEY = "[Key not stored - check OpenRouter]"
+# export-keys lists every key up to SUMMARY_MAX_ROWS, else the first
+# SUMMARY_PREVIEW_ROWS and a totals row
+SUMMARY_MAX_ROWS = 50
+SUMMARY_PREVIEW_ROWS = 10
+
+# Selects rows already formatted for export, in EXPORT_KEYS_FIELDS order, so
+# the CSV writer takes them as-is; bind :missing_api_key to MISSING_API_KEY.
+# idx_key_email serves both the join and the ORDER BY: key is walked in email
+# order with a primary-key probe into student per row and no sort step.
+EXPORT_KEYS_QUERY = """
+    SELECT s.first_name, s.last_name, k.email, COALESCE(s.mq_id, ''),
+           COALESCE(NULLIF(k.key_label, ''), :missing_api_key), k.key_name,
+           COALESCE(NULLIF(k.credit_limit, 0), 'unlimited'),
+           CASE WHEN k.disabled THEN 'true' ELSE 'false' END
+    FROM key k
+    JOIN student s ON k.email = s.email
+    ORDER BY k.email
+"""
+# Latest usage row per key, as {key_hash: usage} once passed to dict(). Both
+# the MAX() per key and the lookup back into usage are served by
+# idx_usage_key_hash_checked, so it never scans the table itself.
+LATEST_USAGE_QUERY = """
+    SELECT key_hash, usage FROM usage
+    WHERE (key_hash, checked_at) IN
+        (SELECT key_hash, MAX(checked_at) FROM usage GROUP BY key_hash)
+"""
+# Row count and stored-key count for the export summary, over the same join
+EXPORT_KEYS_COUNT_QUERY = """
+    SELECT COUNT(*), COUNT(NULLIF(k.key_label, ''))
+    FROM key k
+    JOIN student s ON k.email = s.email
+"""
+
+# OpenRouter returns the key list in pages of (at most) this many keys
+KEYS_PAGE_SIZE = 100
+
+# (connect, read) timeouts for OpenRouter calls: fail fast on an unreachable
+# host, but give slow responses the full 30s
+API_TIMEOUT = (3.05, 30)
+
+# Shared HTTP session so consecutive API calls reuse one keep-alive TLS
+# connection instead of handshaking per request. Only connection failures are
+# retried here -- the request never reached OpenRouter, so even a key-creating
+# POST is safe to resend. 429s are handled by RateLimiter.call().
+_SESSION = requests.Session()
+_SESSION.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=16,
+        max_retries=Retry(total=3, connect=3, read=0, status=0, other=0, backoff_factor=0.5),
+    ),
+)
 
 
 # ============ COMMON FUNCTIONS ============
 
 
-def fetch_openrouter_keys(api_key):
-    """Fetch all keys from OpenRouter. This is the source of truth."""
+def iter_openrouter_key_pages(api_key):
+    """Yield pages of keys from OpenRouter's offset-paginated list endpoint.
+
+    A page shorter than KEYS_PAGE_SIZE is the last one, so accounts that fit
+    in a single page cost a single request. An empty page, or one holding
+    only keys already seen (an API ignoring `offset`), also ends the list
+    rather than looping forever.
+    """
     url = "https://openrouter.ai/api/v1/keys"
     headers = {"Authorization": f"Bearer {api_key}"}
+    offset = 0
+    seen = set()
+
+    while True:
+        params = {"offset": offset} if offset else None
+        response = _SESSION.get(url, headers=headers, params=params, timeout=API_TIMEOUT)
+        if response.status_code != 200:
+            raise click.ClickException(f"Error fetching keys: {response.status_code}")
+
+        page = _json_loads(response.content)["data"]
+        hashes = {key["hash"] for key in page}
+        if hashes <= seen:
+            return
+        seen |= hashes
+        yield page
+        if len(page) < KEYS_PAGE_SIZE:
+            return
+        offset += len(page)
+
+
+def fetch_openrouter_keys(api_key):
+    """Fetch all keys from OpenRouter. This is the source of truth."""
+    return [key for page in iter_openrouter_key_pages(api_key) for key in page]
+
 
-    response = requests.get(url, headers=headers, timeout=30)
-    if response.status_code != 200:
-        raise click.ClickException(f"Error fetching keys: {response.status_code}")
+def _iter_csv_columns(reader, columns, missing=None):
+    """Yield a tuple of the named columns for each non-blank row of a csv.reader.
 
-    return response.json()["data"]
+    Picks fields by header position, avoiding the per-row dict that
+    csv.DictReader builds. Columns absent from the header, and fields absent
+    from short rows, come back as `missing`. While a row is being handled,
+    `reader.line_num` is its (last) line in the file.
+    """
+    header = next(reader, None)
+    if header is None:
+        return
+    width = len(header)
+    positions = {name: i for i, name in enumerate(header)}
+    # Absent columns read slot `width`, which every row gets as padding.
+    slots = [positions.get(name, width) for name in columns]
+    if len(slots) == 1:
+        # itemgetter with one index returns the bare value, not a 1-tuple
+        (slot,) = slots
+
+        def pick(values):
+            return (values[slot],)
+    else:
+        pick = itemgetter(*slots)
+    padding = [missing] * width
+    for values in reader:
+        if not values:
+            continue
+        if len(values) < width:
+            values.extend(padding[len(values) :])
+        elif len(values) > width:
+            del values[width:]
+        values.append(missing)
+        yield pick(values)
 
 
 def validate_roster_row(row, line_number):
@@ -68,10 +281,9 @@ def validate_roster_row(row, line_number):
     Raises click.ClickException with a clear message if any required field
     is missing or empty.
     """
-    required_fields = ["first_name", "last_name", "mq_id"]
-    for field in required_fields:
-        value = row.get(field, "").strip()
-        if not value:
+    for field in REQUIRED_ROSTER_FIELDS:
+        value = row.get(field)
+        if not value or not value.strip():
             raise click.ClickException(
                 f"Roster row {line_number} (email={row.get('email', '?')}): "
                 f"required field '{field}' is empty. "
@@ -83,80 +295,115 @@ def load_roster(roster_path="roster.csv"):
     """Load roster mapping email -> student info dict.
 
     Returns {email: {'first_name': str, 'last_name': str, 'mq_id': str,
-                      'budget': float|None, 'limit_reset': str|None}}
+                      'budget': float|None, 'limit_reset': str|None,
+                      '_display_name': str}}
 
     Raises click.ClickException if any row is missing required fields.
     """
+    try:
+        f = open(roster_path, newline="")  # noqa: SIM115 -- closed by the with below
+    except FileNotFoundError:
+        return {}
     roster = {}
-    if Path(roster_path).exists():
-        with open(roster_path) as f:
-            reader = csv.DictReader(f)
-            for line_number, row in enumerate(
-                reader, start=2
-            ):  # start=2: header is line 1
-                validate_roster_row(row, line_number)
-                budget = row.get("budget", "")
-                limit_reset = row.get("limit_reset", "").strip().lower() or None
-                if limit_reset and limit_reset not in VALID_LIMIT_RESETS:
-                    raise click.ClickException(
-                        f"Invalid limit_reset '{limit_reset}' for {row['email']}. "
-                        f"Valid values: {', '.join(sorted(VALID_LIMIT_RESETS))}"
-                    )
-                roster[row["email"]] = {
-                    "first_name": row["first_name"].strip(),
-                    "last_name": row["last_name"].strip(),
-                    "mq_id": row["mq_id"].strip(),
-                    "budget": float(budget) if budget else None,
-                    "limit_reset": limit_reset,
-                }
+    with f:
+        reader = csv.reader(f)
+        for values in _iter_csv_columns(reader, ROSTER_FIELDS, missing=""):
+            raw_first, raw_last, email, raw_mq_id, budget, raw_reset = values
+            first_name = raw_first.strip()
+            last_name = raw_last.strip()
+            mq_id = raw_mq_id.strip()
+            if not (first_name and last_name and mq_id):
+                # Line in the file, counting the header and any blank lines
+                validate_roster_row(dict(zip(ROSTER_FIELDS, values, strict=True)), reader.line_num)
+            limit_reset = raw_reset.strip().lower() or None
+            if limit_reset and limit_reset not in VALID_LIMIT_RESETS:
+                raise click.ClickException(
+                    f"Invalid limit_reset '{limit_reset}' for {email}. "
+                    f"Valid values: {', '.join(sorted(VALID_LIMIT_RESETS))}"
+                )
+            roster[email] = {
+                "first_name": first_name,
+                "last_name": last_name,
+                "mq_id": mq_id,
+                "budget": float(budget) if budget else None,
+                "limit_reset": limit_reset,
+                "_display_name": f"{first_name} {last_name}",
+            }
     return roster
 
 
+@contextmanager
+def atomic_write(path, mode="w", fsync=False, **kwargs):
+    """Open `path` for writing via a temp file renamed over it on success.
+
+    Readers (and a crash mid-write) see either the old file or the complete
+    new one, never a partial file. If the block raises, the temp file is
+    removed and `path` is left untouched. `fsync=True` flushes the data to
+    disk before the rename, for files that cannot be regenerated.
+    """
+    tmp_path = f"{path}.tmp"
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        Path(tmp_path).unlink(missing_ok=True)
+        raise
+
+
 def save_roster(roster_dict, roster_path="roster.csv"):
     """Save roster from dict"""
-    with open(roster_path, "w", newline="") as f:
-        writer = csv.DictWriter(
-            f,
-            fieldnames=[
-                "first_name",
-                "last_name",
-                "email",
-                "mq_id",
-                "budget",
-                "limit_reset",
-            ],
-        )
-        writer.writeheader()
-        for email, info in sorted(roster_dict.items()):
-            writer.writerow(
-                {
-                    "email": email,
-                    "first_name": info["first_name"],
-                    "last_name": info["last_name"],
-                    "mq_id": info.get("mq_id", ""),
-                    "budget": info["budget"] if info.get("budget") else "",
-                    "limit_reset": info.get("limit_reset") or "",
-                }
+    with atomic_write(roster_path, newline="", buffering=WRITE_BUFFER_SIZE) as f:
+        writer = csv.writer(f)
+        writer.writerow(ROSTER_FIELDS)
+        # Tuples in ROSTER_FIELDS order; no per-row dict for DictWriter to unpack
+        writer.writerows(
+            (
+                info["first_name"],
+                info["last_name"],
+                email,
+                info.get("mq_id", ""),
+                info["budget"] if info.get("budget") else "",
+                info.get("limit_reset") or "",
             )
+            for email, info in sorted(roster_dict.items())
+        )
 
 
 def display_name(student_info):
-    """Build display name from student info dict."""
-    return f"{student_info['first_name']} {student_info['last_name']}".strip()
+    """Build display name from student info dict.
+
+    Roster entries from load_roster carry it precomputed as `_display_name`.
+    """
+    return (
+        student_info.get("_display_name")
+        or f"{student_info['first_name']} {student_info['last_name']}".strip()
+    )
 
 
 def parse_key_name(key_name):
     """Extract date, display name, and mq_id from key name like '20260227_Chaeyeon Kim_60853425'"""
-    match = re.match(r"^(\d{8})_(.+)_(\w+)$", key_name)
-    if match:
-        return match.group(1), match.group(2), match.group(3)  # date, name, mq_id
-    # Fallback for keys without mq_id suffix
-    match = re.match(r"^(\d{8})_(.+)$", key_name)
+    # Fast path for well-formed names, without the regex engine. The checks
+    # mirror _KEY_NAME_RE exactly (\w is isalnum() or "_", and "." never
+    # matches a newline), so anything unusual falls through to the regex.
+    head, sep, tail = key_name.rpartition("_")
+    if sep and tail.isalnum() and len(head) > 9 and head[8] == "_" and head[:8].isdecimal() and "\n" not in head:
+        return head[:8], head[9:], tail
+    match = _KEY_NAME_RE.match(key_name)
     if match:
-        return match.group(1), match.group(2), None
+        date, name, mq_id, legacy_name = match.groups()
+        return date, name or legacy_name, mq_id
     return None, key_name, None
 
 
+def extract_mq_id(key_name):
+    """Return the MQ ID suffix of a key name, or None."""
+    return parse_key_name(key_name)[2]
+
+
 def build_key_name(student_info, date=None):
     """Build key name: YYYYMMDD_FirstName LastName_MQID"""
     if date is None:
@@ -165,24 +412,29 @@ def build_key_name(student_info, date=None):
     return f"{date}_{name}_{student_info['mq_id']}"
 
 
-def map_keys_to_roster(openrouter_keys, roster):
+def index_roster_by_mq_id(roster):
+    """Build the mq_id -> (email, student_info) lookup used for key matching."""
+    return {info["mq_id"]: (email, info) for email, info in roster.items() if info.get("mq_id")}
+
+
+def map_keys_to_roster(openrouter_keys, roster, mq_id_lookup=None):
     """Match OpenRouter keys to roster entries by MQ ID.
 
+    Commands that match more than once against the same roster can pass a
+    prebuilt `mq_id_lookup` from index_roster_by_mq_id() to skip rebuilding it.
+
     Returns (matched, orphaned) where:
-      matched = [(key, email, student_info), ...]
+      matched = [(key, email, student_info), ...] sorted by email
       orphaned = [(key, key_name), ...]
     """
-    # Build mq_id -> (email, info) lookup
-    mq_id_lookup = {}
-    for email, info in roster.items():
-        if info.get("mq_id"):
-            mq_id_lookup[info["mq_id"]] = (email, info)
+    if mq_id_lookup is None:
+        mq_id_lookup = index_roster_by_mq_id(roster)
 
     matched = []
     orphaned = []
 
     for key in openrouter_keys:
-        _, _, extracted_mq_id = parse_key_name(key["name"])
+        extracted_mq_id = extract_mq_id(key["name"])
 
         if extracted_mq_id and extracted_mq_id in mq_id_lookup:
             email, info = mq_id_lookup[extracted_mq_id]
@@ -190,166 +442,335 @@ def map_keys_to_roster(openrouter_keys, roster):
         else:
             orphaned.append((key, key["name"]))
 
+    # Sorted once here for every consumer (limits, snapshot, key table)
+    matched.sort(key=itemgetter(1))
     return matched, orphaned
 
 
+def limits_equal(a, b):
+    """Compare two credit limits, ignoring float noise from CSV round-trips.
+
+    None (unlimited) only equals None; non-numeric values compare exactly.
+    """
+    if isinstance(a, int | float) and isinstance(b, int | float):
+        return math.isclose(a, b, rel_tol=0, abs_tol=1e-6)
+    return a == b
+
+
 def load_limits(limits_path="limits.csv"):
     """Load existing limits file with targets"""
-    limits = {}
-    if Path(limits_path).exists():
-        with open(limits_path) as f:
-            reader = csv.DictReader(f)
-            for row in reader:
-                limits[row["email"]] = {
-                    "target_limit": row.get("target_limit"),
-                    "target_disabled": row.get("target_disabled"),
-                }
-    return limits
-
-
-def save_limits(openrouter_keys, roster, limits_path="limits.csv"):
-    """Save limits.csv preserving targets where they exist"""
-    existing_limits = load_limits(limits_path)
-    matched, orphaned = map_keys_to_roster(openrouter_keys, roster)
-
-    with open(limits_path, "w", newline="") as f:
-        fieldnames = [
-            "email",
-            "name",
-            "mq_id",
-            "target_limit",
-            "actual_limit",
-            "target_disabled",
-            "actual_disabled",
-            "key_name",
-            "hash",
-        ]
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for key, email, info in sorted(matched, key=lambda x: x[1]):
-            if email in existing_limits and existing_limits[email].get("target_limit"):
-                target_limit_str = existing_limits[email]["target_limit"]
-                target_limit = (
-                    None if target_limit_str == "unlimited" else float(target_limit_str)
-                )
-            else:
-                target_limit = key.get("limit")
+    try:
+        f = open(limits_path, newline="")  # noqa: SIM115 -- closed by the with below
+    except FileNotFoundError:
+        return {}
+    with f:
+        columns = ("email", "target_limit", "target_disabled")
+        return {
+            email: {"target_limit": target_limit, "target_disabled": target_disabled}
+            for email, target_limit, target_disabled in _iter_csv_columns(csv.reader(f), columns)
+        }
+
+
+LIMITS_FIELDS = (
+    "email",
+    "name",
+    "mq_id",
+    "target_limit",
+    "actual_limit",
+    "target_disabled",
+    "actual_disabled",
+    "key_name",
+    "hash",
+)
+SNAPSHOT_FIELDS = (
+    "email",
+    "name",
+    "mq_id",
+    "key_name",
+    "hash",
+    "usage",
+    "limit",
+    "limit_reset",
+    "disabled",
+)
 
-            if email in existing_limits and existing_limits[email].get(
-                "target_disabled"
-            ):
-                target_disabled = (
-                    existing_limits[email]["target_disabled"].lower() == "true"
-                )
-            else:
-                target_disabled = key.get("disabled", False)
 
-            writer.writerow(
-                {
-                    "email": email,
-                    "name": display_name(info),
-                    "mq_id": info.get("mq_id", ""),
-                    "target_limit": target_limit if target_limit else "unlimited",
-                    "actual_limit": key.get("limit")
-                    if key.get("limit")
-                    else "unlimited",
-                    "target_disabled": str(target_disabled).lower(),
-                    "actual_disabled": str(key.get("disabled", False)).lower(),
-                    "key_name": key["name"],
-                    "hash": key["hash"],
-                }
-            )
+def _limits_row(key, email, info, name, actual_limit, existing_limits):
+    """Build one limits.csv row, keeping any target already set for `email`."""
+    targets = existing_limits.get(email)
+    target_limit_str = targets and targets["target_limit"]
+    if target_limit_str:
+        target_limit = None if target_limit_str == "unlimited" else float(target_limit_str)
+    else:
+        target_limit = key.get("limit")
 
+    target_disabled_str = targets and targets["target_disabled"]
+    if target_disabled_str:
+        target_disabled = target_disabled_str.strip().lower() in TRUTHY_VALUES
+    else:
+        target_disabled = key.get("disabled", False)
+
+    return {
+        "email": email,
+        "name": name,
+        "mq_id": info.get("mq_id", ""),
+        "target_limit": target_limit if target_limit else "unlimited",
+        "actual_limit": actual_limit,
+        "target_disabled": str(target_disabled).lower(),
+        "actual_disabled": str(key.get("disabled", False)).lower(),
+        "key_name": key["name"],
+        "hash": key["hash"],
+    }
+
+
+def _snapshot_row(key, email, info, name, actual_limit):
+    """Build one snapshot CSV row."""
+    return [
+        email,
+        name,
+        info.get("mq_id", ""),
+        key["name"],
+        key["hash"],
+        key.get("usage", 0),
+        actual_limit,
+        key.get("limit_reset") or "",
+        key.get("disabled", False),
+    ]
+
+
+def _write_limits_file(rows, limits_path):
+    with atomic_write(limits_path, newline="", buffering=WRITE_BUFFER_SIZE) as f:
+        writer = csv.DictWriter(f, fieldnames=LIMITS_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
 
-def export_snapshot(openrouter_keys, roster, prefix="snapshot"):
-    """Export timestamped snapshot"""
-    matched, orphaned = map_keys_to_roster(openrouter_keys, roster)
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+def _write_snapshot_file(rows, prefix, now=None):
+    timestamp = (now or datetime.now()).strftime("%Y%m%d_%H%M%S")
     filename = f"{prefix}_{timestamp}.csv"
 
-    with open(filename, "w", newline="") as f:
+    with atomic_write(filename, newline="", buffering=WRITE_BUFFER_SIZE) as f:
         writer = csv.writer(f)
-        writer.writerow(
-            [
-                "email",
-                "name",
-                "mq_id",
-                "key_name",
-                "hash",
-                "usage",
-                "limit",
-                "limit_reset",
-                "disabled",
-            ]
+        writer.writerow(SNAPSHOT_FIELDS)
+        writer.writerows(rows)
+
+    return filename
+
+
+def save_limits(matched, limits_path="limits.csv", existing_limits=None):
+    """Save limits.csv preserving targets where they exist.
+
+    `matched` is the first element of map_keys_to_roster's result, already
+    sorted by email. Pass `existing_limits` (as returned by load_limits) when
+    the caller has already parsed the file; otherwise it is read here.
+
+    Returns the rows written, as dicts keyed by LIMITS_FIELDS.
+    """
+    if existing_limits is None:
+        existing_limits = load_limits(limits_path)
+    rows = [
+        _limits_row(
+            key, email, info, display_name(info), key.get("limit") or "unlimited", existing_limits
         )
+        for key, email, info in matched
+    ]
+    _write_limits_file(rows, limits_path)
+    return rows
 
-        for key, email, info in sorted(matched, key=lambda x: x[1]):
-            writer.writerow(
-                [
-                    email,
-                    display_name(info),
-                    info.get("mq_id", ""),
-                    key["name"],
-                    key["hash"],
-                    key.get("usage", 0),
-                    key.get("limit") if key.get("limit") else "unlimited",
-                    key.get("limit_reset") or "",
-                    key.get("disabled", False),
-                ]
-            )
 
-    return filename
+def export_snapshot(matched, prefix="snapshot", now=None):
+    """Export timestamped snapshot of matched keys (already sorted by email).
+
+    The filename is stamped with `now` (a datetime, default the current time).
+    """
+    # Rows are streamed straight into writerows(); nothing else needs them
+    rows = (
+        _snapshot_row(key, email, info, display_name(info), key.get("limit") or "unlimited")
+        for key, email, info in matched
+    )
+    return _write_snapshot_file(rows, prefix, now)
+
+
+def write_state_files(matched, limits_path="limits.csv", prefix="snapshot", existing_limits=None, now=None):
+    """Save limits.csv and export a snapshot in a single pass over `matched`.
+
+    Equivalent to save_limits() followed by export_snapshot(), but each
+    student's display name and limit string are computed once for both files.
+    The snapshot filename is stamped with `now` (default the current time).
+    Returns the snapshot filename.
+    """
+    if existing_limits is None:
+        existing_limits = load_limits(limits_path)
+    limits_rows, snapshot_rows = [], []
+    for key, email, info in matched:
+        name = display_name(info)
+        actual_limit = key.get("limit") or "unlimited"
+        limits_rows.append(_limits_row(key, email, info, name, actual_limit, existing_limits))
+        snapshot_rows.append(_snapshot_row(key, email, info, name, actual_limit))
+
+    _write_limits_file(limits_rows, limits_path)
+    return _write_snapshot_file(snapshot_rows, prefix, now)
 
 
-def update_database(conn, openrouter_keys, roster):
-    """Update database with current state"""
+def connect_db(db, read_only=False):
+    """Open the local database with the pragmas every command relies on.
+
+    WAL + synchronous=NORMAL means a commit costs one WAL append rather than a
+    rollback-journal fsync, and readers never block the writer.
+
+    `read_only` opens the file with mode=ro for commands that only query it
+    (export-keys): any write fails, and pages are read through mmap rather
+    than a read() per page.
+    """
+    # isolation_level=None: no implicit BEGIN before DML; writes that must be
+    # atomic are grouped explicitly with transaction().
+    if read_only:
+        conn = sqlite3.connect(f"{Path(db).resolve().as_uri()}?mode=ro", uri=True, isolation_level=None)
+        conn.execute("PRAGMA query_only=1")
+        conn.execute("PRAGMA mmap_size=268435456")  # map up to 256 MiB of the file
+    else:
+        conn = sqlite3.connect(db, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA cache_size=-65536")  # up to 64 MiB of page cache
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+@contextmanager
+def transaction(conn):
+    """Group the enclosed statements into one BEGIN IMMEDIATE ... COMMIT.
+
+    Rolls back if the block raises. If `conn` is already inside a transaction
+    the block simply joins it, so helpers can be composed by callers that need
+    a larger atomic unit.
+    """
+    if conn.in_transaction:
+        yield
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def update_database(conn, matched, timestamp=None):
+    """Update database with current state of the matched keys.
+
+    All writes happen in a single transaction, committed on success and rolled
+    back if any insert fails. `timestamp` (ISO format, default now) stamps the
+    rows, letting a command record one time for everything it writes.
+    """
+    if timestamp is None:
+        timestamp = datetime.now().isoformat()
+
+    # Latest recorded usage per key; only changed values get a new usage row.
     c = conn.cursor()
-    timestamp = datetime.now().isoformat()
-    matched, orphaned = map_keys_to_roster(openrouter_keys, roster)
+    c.execute(LATEST_USAGE_QUERY)
+    last_usage = dict(c.fetchall())
 
+    # One student row per email, even when a student has several keys
+    student_rows, key_rows, usage_rows = {}, [], []
     for key, email, info in matched:
+        student_rows[email] = (email, info["first_name"], info["last_name"], info["mq_id"], timestamp)
+        key_rows.append(
+            (
+                key["hash"],
+                key.get("label", ""),
+                email,
+                key["name"],
+                key.get("created_at", timestamp),
+                key.get("limit"),
+                key.get("disabled", False),
+            )
+        )
+        usage = key.get("usage", 0)
+        if last_usage.get(key["hash"]) != usage:
+            usage_rows.append((key["hash"], usage, timestamp))
+
+    with transaction(conn):
         # Upsert student: ON CONFLICT(email) preserves created_at and avoids the
         # DELETE+INSERT semantics of INSERT OR REPLACE, which could silently remove
         # rows when mq_id uniqueness is violated by duplicate empty values.
-        c.execute(
+        # executemany runs one prepared statement over all rows; staging them
+        # in a temp table for a single INSERT ... SELECT measured slower.
+        c.executemany(
             """INSERT INTO student (email, first_name, last_name, mq_id, created_at)
                      VALUES (?, ?, ?, ?, ?)
                      ON CONFLICT(email) DO UPDATE SET
                          first_name=excluded.first_name,
                          last_name=excluded.last_name,
-                         mq_id=excluded.mq_id""",
-            (email, info["first_name"], info["last_name"], info["mq_id"], timestamp),
+                         mq_id=excluded.mq_id
+                     WHERE (first_name, last_name, mq_id)
+                         IS NOT (excluded.first_name, excluded.last_name, excluded.mq_id)""",
+            student_rows.values(),
         )
 
-        # Upsert key
-        c.execute(
-            """INSERT OR REPLACE INTO key
+        # Upsert key: as for students, update in place rather than REPLACE so
+        # created_at survives and rows referenced by usage/changelog are never
+        # deleted and re-inserted.
+        c.executemany(
+            """INSERT INTO key
                     (key_hash, key_label, email, key_name, created_at, credit_limit, disabled)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)""",
-            (
-                key["hash"],
-                key.get("label", ""),
-                email,
-                key["name"],
-                key.get("created_at", timestamp),
-                key.get("limit"),
-                key.get("disabled", False),
-            ),
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(key_hash) DO UPDATE SET
+                        key_label=excluded.key_label,
+                        email=excluded.email,
+                        key_name=excluded.key_name,
+                        credit_limit=excluded.credit_limit,
+                        disabled=excluded.disabled
+                    WHERE (key_label, email, key_name, credit_limit, disabled)
+                        IS NOT (excluded.key_label, excluded.email, excluded.key_name,
+                                excluded.credit_limit, excluded.disabled)""",
+            key_rows,
         )
 
-        # Record usage snapshot
-        c.execute(
+        # Record usage snapshot for keys whose usage changed
+        c.executemany(
             "INSERT INTO usage (key_hash, usage, checked_at) VALUES (?, ?, ?)",
-            (key["hash"], key.get("usage", 0), timestamp),
+            usage_rows,
         )
 
-    conn.commit()
+
+class RateLimited(click.ClickException):
+    """OpenRouter answered 429; `retry_after` is how long it asked us to wait."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _retry_after(response):
+    """Seconds the server asked us to wait via Retry-After, defaulting to 1."""
+    try:
+        return float(response.headers.get("Retry-After", 1))
+    except ValueError:  # an HTTP date rather than seconds
+        return 1.0
 
 
-def create_openrouter_key(api_key, name, limit=None, limit_reset=None):
-    """Create a new key in OpenRouter"""
+def _check_rate_limit(response, message, limiter=None):
+    """Raise RateLimited if `response` is a 429, honouring its Retry-After header.
+
+    Otherwise, if X-RateLimit-Remaining shows the budget nearly spent, hold
+    `limiter` for the Retry-After delay before its next call goes out.
+    """
+    if response.status_code == 429:
+        raise RateLimited(f"{message}: 429 rate limited", _retry_after(response))
+    if limiter is not None:
+        try:
+            remaining = int(response.headers.get("X-RateLimit-Remaining", ""))
+        except ValueError:  # header absent or malformed
+            return
+        if remaining <= API_RATELIMIT_LOW_WATER:
+            limiter.hold(min(_retry_after(response), API_MAX_RETRY_AFTER))
+
+
+def create_openrouter_key(api_key, name, limit=None, limit_reset=None, limiter=None):
+    """Create a new key in OpenRouter, pacing `limiter` from the rate-limit headers"""
     url = "https://openrouter.ai/api/v1/keys"
     payload = {"name": name}
     if limit is not None:
@@ -359,22 +780,23 @@ def create_openrouter_key(api_key, name, limit=None, limit_reset=None):
 
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
 
-    response = requests.post(url, json=payload, headers=headers, timeout=30)
+    response = _SESSION.post(url, data=_json_dumps(payload), headers=headers, timeout=API_TIMEOUT)
+    _check_rate_limit(response, f"Error creating key for {name}", limiter)
     if response.status_code not in [200, 201]:
         raise click.ClickException(
             f"Error creating key for {name}: {response.status_code}"
         )
 
-    return response.json()
+    return _json_loads(response.content)
 
 
 def update_openrouter_key(
-    api_key, key_hash, limit=None, disabled=None, limit_reset=None
+    api_key, key_hash, limit=_UNCHANGED, disabled=None, limit_reset=None, limiter=None
 ):
-    """Update an existing key in OpenRouter"""
+    """Update an existing key in OpenRouter, pacing `limiter` from the rate-limit headers"""
     url = f"https://openrouter.ai/api/v1/keys/{key_hash}"
     payload = {}
-    if limit is not None:
+    if limit is not _UNCHANGED:
         payload["limit"] = limit
     if disabled is not None:
         payload["disabled"] = disabled
@@ -383,17 +805,164 @@ def update_openrouter_key(
 
     headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
 
-    response = requests.patch(url, json=payload, headers=headers, timeout=30)
+    response = _SESSION.patch(url, data=_json_dumps(payload), headers=headers, timeout=API_TIMEOUT)
+    _check_rate_limit(response, f"Error updating key {key_hash[:8]}...", limiter)
     if response.status_code not in [200, 201, 204]:
         raise click.ClickException(
             f"Error updating key {key_hash[:8]}...: {response.status_code}"
         )
 
-    return response.json() if response.status_code != 204 else {}
+    return _json_loads(response.content) if response.status_code != 204 else {}
+
+
+@dataclass(slots=True)
+class Change:
+    """One pending change to a key, planned by `update` from limits.csv."""
+
+    email: str
+    key_hash: str
+    key_name: str
+    change_type: str  # "limit" or "disabled"
+    old_value: object
+    new_value: object
+
+
+def iter_changes(existing_limits, email_to_key):
+    """Yield a Change for each target in limits.csv that differs from OpenRouter.
+
+    `existing_limits` is load_limits' result and `email_to_key` maps emails to
+    current OpenRouter keys; emails without a key are skipped.
+    """
+    for email, targets in existing_limits.items():
+        key = email_to_key.get(email)
+        if key is None:
+            continue
+
+        target_limit = targets["target_limit"]
+        actual_limit = key.get("limit")
+
+        if target_limit == "unlimited":
+            target_limit = None
+        elif target_limit:
+            target_limit = float(target_limit)
+
+        if not limits_equal(target_limit, actual_limit):
+            yield Change(email, key["hash"], key["name"], "limit", actual_limit, target_limit)
+
+        target_disabled = targets["target_disabled"].strip().lower() in TRUTHY_VALUES
+        actual_disabled = bool(key.get("disabled"))
+
+        if target_disabled != actual_disabled:
+            yield Change(email, key["hash"], key["name"], "disabled", actual_disabled, target_disabled)
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing calls at least 1/rate seconds apart.
+
+    The rate adapts AIMD-style: each 429 halves it (down to `min_rate`) and
+    pauses every caller for the server's Retry-After; each success adds
+    `increase` requests/second back, up to the configured `rate`.
+    """
+
+    def __init__(self, rate, min_rate=None, increase=0.1):
+        self.max_rate = rate
+        self.min_rate = min_rate if min_rate is not None else rate / 16
+        self.increase = increase
+        self.interval = 1.0 / rate
+        self._lock = threading.Lock()
+        self._next_slot = time.monotonic()
+
+    @property
+    def rate(self):
+        return 1.0 / self.interval
+
+    def succeeded(self):
+        """Additive increase after a request got through."""
+        with self._lock:
+            self.interval = 1.0 / min(self.max_rate, self.rate + self.increase)
+
+    def back_off(self, delay):
+        """Multiplicative decrease, and hold every caller for `delay` seconds."""
+        with self._lock:
+            self.interval = 1.0 / max(self.min_rate, self.rate / 2)
+        self.hold(delay)
+
+    def hold(self, delay):
+        """Hold every caller for `delay` seconds without changing the rate."""
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + delay)
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn` in a rate-limited slot, retrying while it raises RateLimited."""
+        for attempt in range(API_MAX_RETRIES + 1):
+            self.wait()
+            try:
+                result = fn(*args, **kwargs)
+            except RateLimited as e:
+                if attempt == API_MAX_RETRIES:
+                    raise
+                self.back_off(min(e.retry_after, API_MAX_RETRY_AFTER))
+                continue
+            self.succeeded()
+            return result
+
+    def wait(self):
+        """Block until the caller's slot comes up."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+def run_api_calls(fn, items, on_done=None):
+    """Call `fn(item)` for each of `items` on API_MAX_WORKERS threads.
+
+    Calls are started in list order, with at most API_MAX_WORKERS in flight,
+    and may complete in any order. `on_done(item)` runs in the calling thread
+    as each call succeeds. After the first failure, or a Ctrl-C, no further
+    calls are started; calls already in flight cannot be recalled, so they
+    are waited for and their results kept.
+
+    Returns (results, failure): results maps item index to `fn`'s return
+    value, and failure is (index, exception) for the first failed call,
+    (None, KeyboardInterrupt) if the run was interrupted, or None.
+    """
+    pending = iter(range(len(items)))
+    results = {}
+    failure = None
+    with ThreadPoolExecutor(max_workers=API_MAX_WORKERS) as executor:
+        # Submitted a few at a time rather than all up front: a queue of
+        # unstarted calls would still run after we stop.
+        in_flight = {executor.submit(fn, items[index]): index for index in islice(pending, API_MAX_WORKERS)}
+        while in_flight:
+            try:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # Forgotten only once its outcome is recorded, so a Ctrl-C
+                    # part-way through leaves it for the next pass
+                    index = in_flight[future]
+                    error = future.exception()
+                    if error is None:
+                        results[index] = future.result()
+                    elif failure is None:
+                        failure = (index, error)
+                    del in_flight[future]
+                    if error is None and on_done is not None:
+                        on_done(items[index])
+                    if failure is None:
+                        for index in islice(pending, 1):
+                            in_flight[executor.submit(fn, items[index])] = index
+            except KeyboardInterrupt as e:
+                if failure is None:
+                    failure = (None, e)
+    return results, failure
 
 
 def print_key_table(matched):
-    """Print a rich table of key status"""
+    """Print a rich table of key status for matched keys (already sorted by email)"""
     table = Table(title="Key Status", show_header=True, header_style="bold magenta")
     table.add_column("Email", style="cyan", no_wrap=True)
     table.add_column("Name")
@@ -404,22 +973,21 @@ def print_key_table(matched):
     table.add_column("Reset", style="dim")
     table.add_column("Status", justify="center")
 
-    for key, email, info in sorted(matched, key=lambda x: x[1]):
-        needs_fixing = PLACEHOLDER_DOMAIN in email
-        status = "[yellow]FIX EMAIL[/yellow]" if needs_fixing else "[green]OK[/green]"
-        usage = f"${key.get('usage', 0):.4f}"
-        limit = f"${key.get('limit')}" if key.get("limit") else "unlimited"
-        reset = key.get("limit_reset") or "-"
-
-        table.add_row(
+    # Row strings are formatted inline and add_row is bound once: with large
+    # rosters this loop runs per student before Rich renders anything.
+    add_row = table.add_row
+    fix_email, ok = "[yellow]FIX EMAIL[/yellow]", "[green]OK[/green]"
+    for key, email, info in matched:
+        limit = key.get("limit")
+        add_row(
             email,
             display_name(info),
             info.get("mq_id", ""),
             key["name"],
-            usage,
-            limit,
-            reset,
-            status,
+            f"${key.get('usage', 0):.4f}",
+            f"${limit}" if limit else "unlimited",
+            key.get("limit_reset") or "-",
+            fix_email if PLACEHOLDER_DOMAIN in email else ok,
         )
 
     console.print(table)
@@ -455,40 +1023,48 @@ def cli(ctx):
 @click.option("--db", default="keys.db")
 def init_db(db):
     """Initialize the database schema"""
-    conn = sqlite3.connect(db)
+    conn = connect_db(db)
     c = conn.cursor()
 
-    # Check if this is an existing database with an old schema.
-    # schema_version table was added in schema version 2. If it is absent the
-    # database was created by an older version of this tool and may be missing
-    # columns or tables added since then.
+    # Check if this is an existing database with an old schema, probing for
+    # both tables in one query. schema_version was added in schema version 2.
+    # If it is absent but our core tables exist, the database was created by
+    # an older version of this tool and may be missing columns or tables
+    # added since then.
     c.execute(
-        "SELECT name FROM sqlite_master WHERE type='table' AND name='schema_version'"
+        "SELECT name FROM sqlite_master WHERE type='table' AND name IN ('schema_version', 'student')"
     )
-    has_version_table = c.fetchone() is not None
+    existing_tables = {row[0] for row in c.fetchall()}
+    has_version_table = "schema_version" in existing_tables
 
-    if not has_version_table:
-        # Check whether any of our core tables already exist (old schema).
-        c.execute(
-            "SELECT name FROM sqlite_master WHERE type='table' AND name='student'"
+    if not has_version_table and "student" in existing_tables:
+        conn.close()
+        raise click.ClickException(
+            "Database schema is outdated. Delete keys.db and re-run init-db."
         )
-        student_table_exists = c.fetchone() is not None
-        if student_table_exists:
-            conn.close()
-            raise click.ClickException(
-                "Database schema is outdated. Delete keys.db and re-run init-db."
-            )
 
     if has_version_table:
         c.execute("SELECT version FROM schema_version")
         row = c.fetchone()
         existing_version = row[0] if row else 0
         if existing_version < SCHEMA_VERSION:
+            steps = range(existing_version, SCHEMA_VERSION)
+            if not all(version in _SCHEMA_MIGRATIONS for version in steps):
+                conn.close()
+                raise click.ClickException(
+                    f"Database schema is outdated (version {existing_version}, current is {SCHEMA_VERSION}). "
+                    "Delete keys.db and re-run init-db."
+                )
+            with transaction(conn):
+                for version in steps:
+                    for statement in _SCHEMA_MIGRATIONS[version]:
+                        c.execute(statement)
+                c.execute("UPDATE schema_version SET version = ?", (SCHEMA_VERSION,))
             conn.close()
-            raise click.ClickException(
-                f"Database schema is outdated (version {existing_version}, current is {SCHEMA_VERSION}). "
-                "Delete keys.db and re-run init-db."
+            console.print(
+                f"[green]Database migrated from schema v{existing_version} to v{SCHEMA_VERSION}: {db}[/green]"
             )
+            return
         # Already at current version — nothing to do.
         conn.close()
         console.print(
@@ -496,43 +1072,12 @@ def init_db(db):
         )
         return
 
-    c.execute("""CREATE TABLE IF NOT EXISTS student
-                 (email TEXT PRIMARY KEY,
-                  first_name TEXT NOT NULL,
-                  last_name TEXT NOT NULL,
-                  mq_id TEXT NOT NULL UNIQUE,
-                  created_at TIMESTAMP)""")
-
-    c.execute("""CREATE TABLE IF NOT EXISTS key
-                 (key_hash TEXT PRIMARY KEY,
-                  key_label TEXT NOT NULL,
-                  email TEXT NOT NULL,
-                  key_name TEXT NOT NULL,
-                  created_at TIMESTAMP,
-                  credit_limit REAL,
-                  disabled BOOLEAN,
-                  FOREIGN KEY(email) REFERENCES student(email))""")
-
-    c.execute("""CREATE TABLE IF NOT EXISTS usage
-                 (id INTEGER PRIMARY KEY,
-                  key_hash TEXT NOT NULL,
-                  usage REAL,
-                  checked_at TIMESTAMP NOT NULL,
-                  FOREIGN KEY(key_hash) REFERENCES key(key_hash))""")
-
-    c.execute("""CREATE TABLE IF NOT EXISTS changelog
-                 (id INTEGER PRIMARY KEY,
-                  key_hash TEXT NOT NULL,
-                  action TEXT NOT NULL,
-                  old_value TEXT,
-                  new_value TEXT,
-                  changed_at TIMESTAMP NOT NULL,
-                  FOREIGN KEY(key_hash) REFERENCES key(key_hash))""")
-
-    c.execute("""CREATE TABLE schema_version (version INTEGER NOT NULL)""")
-    c.execute("INSERT INTO schema_version (version) VALUES (?)", (SCHEMA_VERSION,))
-
-    conn.commit()
+    # Create everything atomically so a failed init leaves no half-built schema.
+    with transaction(conn):
+        for statement in _SCHEMA_TABLES + _SCHEMA_INDEXES:
+            c.execute(statement)
+        c.execute("INSERT INTO schema_version (version) VALUES (?)", (SCHEMA_VERSION,))
+
     conn.close()
 
     console.print(
@@ -551,18 +1096,18 @@ def check(ctx, roster, db):
         console.print(f"[red]Error: Database {db} not found. Run 'init-db' first[/red]")
         sys.exit(1)
 
-    # 1. Fetch all keys from OpenRouter (source of truth)
-    console.print("[cyan]Fetching keys from OpenRouter...[/cyan]")
-    openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
-    console.print(f"Found {len(openrouter_keys)} keys in OpenRouter")
-
-    # 2. Load roster
+    # 1. Load roster first, so an invalid roster fails before the network fetch
     roster_data = load_roster(roster)
     if roster_data:
         console.print(f"Found {len(roster_data)} students in roster")
     else:
         console.print(f"No roster file found at {roster} or file is empty")
 
+    # 2. Fetch all keys from OpenRouter (source of truth)
+    console.print("[cyan]Fetching keys from OpenRouter...[/cyan]")
+    openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
+    console.print(f"Found {len(openrouter_keys)} keys in OpenRouter")
+
     # 3. Match keys to roster
     matched, orphaned = map_keys_to_roster(openrouter_keys, roster_data)
 
@@ -571,21 +1116,25 @@ def check(ctx, roster, db):
         console.print(
             f"\n[yellow]{len(orphaned)} keys in OpenRouter not matched to roster:[/yellow]"
         )
+        lines = []
         for key, _extracted_id in orphaned:
             usage = f"${key.get('usage', 0):.4f}"
             disabled = " [dim](disabled)[/dim]" if key.get("disabled") else ""
-            console.print(f"  {key['name']} - usage: {usage}{disabled}")
+            lines.append(f"  {key['name']} - usage: {usage}{disabled}")
+        console.print("\n".join(lines))
         console.print(
             "[dim]These keys are not managed by this tool. Update roster or manage via OpenRouter dashboard.[/dim]"
         )
 
     # 5. Update database with current state
-    conn = sqlite3.connect(db)
-    update_database(conn, openrouter_keys, roster_data)
+    # The database rows and the snapshot filename share one clock reading
+    now = datetime.now()
+    conn = connect_db(db)
+    update_database(conn, matched, now.isoformat())
     conn.close()
 
     # 6. Export snapshot
-    snapshot_file = export_snapshot(openrouter_keys, roster_data)
+    snapshot_file = export_snapshot(matched, now=now)
     console.print(f"\n[green]Exported snapshot to {snapshot_file}[/green]")
 
     # 7. Summary with rich table
@@ -626,35 +1175,43 @@ def provision(ctx, roster, limit, db, dry_run):
         console.print(f"[red]Error: Database {db} not found. Run 'init-db' first[/red]")
         sys.exit(1)
 
-    # 1. Fetch current state from OpenRouter (source of truth)
-    console.print("[cyan]Fetching current keys from OpenRouter...[/cyan]")
-    openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
-    console.print(f"Found {len(openrouter_keys)} existing keys")
+    # Every key in this run is named with the same date, even across midnight,
+    # and the api_keys file is stamped with the run's start time.
+    run_start = datetime.now()
+    key_date = run_start.strftime("%Y%m%d")
 
-    # 2. Load roster
+    # 1. Load roster first, so an empty or invalid roster fails before the
+    # network fetch
     roster_data = load_roster(roster)
     if not roster_data:
         console.print("[red]Error: roster.csv is empty[/red]")
         sys.exit(1)
     console.print(f"Found {len(roster_data)} students in roster")
+    roster_index = index_roster_by_mq_id(roster_data)
+
+    # 2. Fetch current state from OpenRouter (source of truth)
+    console.print("[cyan]Fetching current keys from OpenRouter...[/cyan]")
+    openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
+    console.print(f"Found {len(openrouter_keys)} existing keys")
 
     # 3. Match current keys to roster
-    matched, orphaned = map_keys_to_roster(openrouter_keys, roster_data)
+    matched, orphaned = map_keys_to_roster(openrouter_keys, roster_data, roster_index)
 
-    # 4. Find who needs provisioning (in roster but no key)
+    # 4. Find who needs provisioning (in roster but no key), sorted by email
+    # once here so the plan, creation and api_keys file all share one order
     already_provisioned = {email for key, email, info in matched}
-    to_provision = []
-
-    for email, info in roster_data.items():
-        if email not in already_provisioned and PLACEHOLDER_DOMAIN not in email:
-            student_limit = limit if limit is not None else info.get("budget")
-            if student_limit is None:
-                console.print(
-                    f"[red]Error: No budget for {email} and no --limit override[/red]"
-                )
-                sys.exit(1)
-            student_reset = info.get("limit_reset")
-            to_provision.append((email, info, student_limit, student_reset))
+    to_provision = [
+        (email, info, limit if limit is not None else info["budget"], info["limit_reset"])
+        for email, info in sorted(roster_data.items())
+        if email not in already_provisioned and PLACEHOLDER_DOMAIN not in email
+    ]
+
+    for email, _info, student_limit, _reset in to_provision:
+        if student_limit is None:
+            console.print(
+                f"[red]Error: No budget for {email} and no --limit override[/red]"
+            )
+            sys.exit(1)
 
     # Check for placeholder emails
     placeholder_emails = [email for email in roster_data if PLACEHOLDER_DOMAIN in email]
@@ -662,23 +1219,19 @@ def provision(ctx, roster, limit, db, dry_run):
         console.print(
             f"\n[yellow]Warning: {len(placeholder_emails)} entries with placeholder emails - skipping[/yellow]"
         )
-        for email in placeholder_emails:
-            console.print(f"  - {email}")
+        console.print("\n".join(f"  - {email}" for email in placeholder_emails))
 
     if not to_provision:
         console.print("\n[green]All students in roster already have keys[/green]")
-        save_limits(openrouter_keys, roster_data)
+        snapshot_file = write_state_files(matched)
         console.print("Updated limits.csv with current state")
-        snapshot_file = export_snapshot(openrouter_keys, roster_data)
         console.print(f"Exported snapshot to {snapshot_file}")
         return
 
     # 6. Show provisioning plan
     console.print(f"\n[cyan]Ready to provision {len(to_provision)} new keys:[/cyan]")
-    for email, info, student_limit, student_reset in sorted(
-        to_provision, key=lambda x: x[0]
-    ):
-        key_name = build_key_name(info)
+    for email, info, student_limit, student_reset in to_provision:
+        key_name = build_key_name(info, date=key_date)
         reset_str = f", resets {student_reset}" if student_reset else ""
         console.print(
             f"  {email} ({info.get('mq_id', '')}) -> {key_name} (limit: ${student_limit}{reset_str})"
@@ -703,82 +1256,52 @@ def provision(ctx, roster, limit, db, dry_run):
             "[cyan]Provisioning keys...[/cyan]", total=len(to_provision)
         )
 
-        for email, info, student_limit, student_reset in to_provision:
-            key_name = build_key_name(info)
+        limiter = RateLimiter(API_RATE_LIMIT)
+
+        def create(entry):
+            _email, info, student_limit, student_reset = entry
+            return limiter.call(
+                create_openrouter_key,
+                ctx.obj["api_key"],
+                build_key_name(info, date=key_date),
+                student_limit,
+                student_reset,
+                limiter=limiter,
+            )
+
+        def created(entry):
             progress.update(
                 task,
-                description=f"Creating key for [yellow]{display_name(info)}[/yellow]",
+                description=f"Created key for [yellow]{display_name(entry[1])}[/yellow]",
             )
+            progress.advance(task)
 
-            try:
-                result = create_openrouter_key(
-                    ctx.obj["api_key"], key_name, student_limit, student_reset
-                )
-
-                created_keys.append(
-                    {
-                        "email": email,
-                        "info": info,
-                        "limit": student_limit,
-                        "limit_reset": student_reset,
-                        "key_data": result["data"],
-                        "api_key": result["key"],
-                    }
-                )
-
-                progress.advance(task)
-                time.sleep(1)  # Be nice to the API
-
-            except Exception as e:
-                console.print(f"\n[red]Error creating key for {email}: {e}[/red]")
-                console.print(
-                    "[yellow]Provisioning halted. Keys created so far have been preserved.[/yellow]"
-                )
-
-                if created_keys:
-                    console.print(
-                        f"[green]Successfully created {len(created_keys)} keys before failure[/green]"
-                    )
-                sys.exit(1)
-
-    # 8. Fetch updated state from OpenRouter
-    console.print("\n[cyan]Fetching updated state from OpenRouter...[/cyan]")
-    openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
-
-    # 9. Update database
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
-    timestamp = datetime.now().isoformat()
-    for key_info in created_keys:
-        c.execute(
-            """INSERT INTO changelog
-                     (key_hash, action, old_value, new_value, changed_at)
-                     VALUES (?, ?, ?, ?, ?)""",
-            (
-                key_info["key_data"]["hash"],
-                "provisioned",
-                None,
-                f"limit={key_info['limit']},reset={key_info.get('limit_reset')}",
-                timestamp,
-            ),
-        )
-
-    update_database(conn, openrouter_keys, roster_data)
-    conn.commit()
-    conn.close()
+        # Keys already in flight when one fails (or on Ctrl-C) still complete
+        # and are saved below with the rest
+        results, failure = run_api_calls(create, to_provision, on_done=created)
 
-    # 10. Save limits.csv
-    save_limits(openrouter_keys, roster_data)
-    console.print("\n[green]Updated limits.csv with current state[/green]")
-
-    # 11. Export snapshot
-    snapshot_file = export_snapshot(openrouter_keys, roster_data)
-    console.print(f"[green]Exported snapshot to {snapshot_file}[/green]")
+        # Keep plan order regardless of completion order
+        for index in sorted(results):
+            email, info, student_limit, student_reset = to_provision[index]
+            result = results[index]
+            created_keys.append(
+                {
+                    "email": email,
+                    "info": info,
+                    "limit": student_limit,
+                    "limit_reset": student_reset,
+                    "key_data": result["data"],
+                    "api_key": result["key"],
+                }
+            )
 
-    # 12. Save API keys for distribution
+    # 8. Save API keys for distribution. This is the only copy of the new
+    # secrets, so it is written before anything else -- and even when the run
+    # halted, since keys created before the halt exist on OpenRouter.
     if created_keys:
-        keys_file = f"api_keys_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
-        with open(keys_file, "w", newline="") as f:
+        keys_file = f"api_keys_{run_start.strftime('%Y%m%d_%H%M%S')}.csv"
+        # Make sure it is complete and on disk
+        with atomic_write(keys_file, newline="", buffering=WRITE_BUFFER_SIZE, fsync=True) as f:
             writer = csv.writer(f)
             writer.writerow(
                 [
@@ -792,21 +1315,72 @@ def provision(ctx, roster, limit, db, dry_run):
                     "limit_reset",
                 ]
             )
-            for key_info in created_keys:
-                info = key_info["info"]
-                writer.writerow(
-                    [
-                        info["first_name"],
-                        info["last_name"],
-                        key_info["email"],
-                        info.get("mq_id", ""),
-                        key_info["api_key"],
-                        key_info["key_data"]["name"],
-                        key_info["limit"],
-                        key_info.get("limit_reset") or "",
-                    ]
+            writer.writerows(
+                [
+                    key_info["info"]["first_name"],
+                    key_info["info"]["last_name"],
+                    key_info["email"],
+                    key_info["info"].get("mq_id", ""),
+                    key_info["api_key"],
+                    key_info["key_data"]["name"],
+                    key_info["limit"],
+                    key_info.get("limit_reset") or "",
+                ]
+                for key_info in created_keys
+            )
+
+    if failure is not None:
+        index, e = failure
+        if index is None:
+            console.print("\n[red]Interrupted[/red]")
+        else:
+            console.print(f"\n[red]Error creating key for {to_provision[index][0]}: {e}[/red]")
+        console.print("[yellow]Provisioning halted; no further keys were started.[/yellow]")
+        if created_keys:
+            console.print(
+                f"[green]Successfully created {len(created_keys)} keys before halting, "
+                f"saved to [cyan]{keys_file}[/cyan][/green]"
+            )
+
+    # 9. Add the created keys, as returned by OpenRouter, to the fetched state.
+    # Only the new keys need matching; both lists are sorted by email, so
+    # they merge in one linear pass.
+    new_keys = [key_info["key_data"] for key_info in created_keys]
+    openrouter_keys += new_keys
+    new_matched, _ = map_keys_to_roster(new_keys, roster_data, roster_index)
+    matched = list(heapq.merge(matched, new_matched, key=itemgetter(1)))
+
+    # 10. Update database
+    conn = connect_db(db)
+    now = datetime.now()
+    timestamp = now.isoformat()
+    with transaction(conn):
+        conn.executemany(
+            INSERT_CHANGELOG_SQL,
+            [
+                (
+                    key_info["key_data"]["hash"],
+                    "provisioned",
+                    None,
+                    f"limit={key_info['limit']},reset={key_info.get('limit_reset')}",
+                    timestamp,
                 )
+                for key_info in created_keys
+            ],
+        )
+
+        update_database(conn, matched, timestamp)
+    conn.close()
 
+    # 11. Save limits.csv and export snapshot
+    snapshot_file = write_state_files(matched, now=now)
+    console.print("\n[green]Updated limits.csv with current state[/green]")
+    console.print(f"[green]Exported snapshot to {snapshot_file}[/green]")
+
+    if failure is not None:
+        sys.exit(1)
+
+    if created_keys:
         console.print(
             Panel.fit(
                 f"[bold green]Successfully created {len(created_keys)} keys![/bold green]\n"
@@ -834,94 +1408,67 @@ def update(ctx, limits, roster, db, dry_run):
         console.print(f"[red]Error: Database {db} not found. Run 'init-db' first[/red]")
         sys.exit(1)
 
-    # 1. Fetch current state from OpenRouter (source of truth)
+    # 1. Load roster and targets first, so there is no network round-trip
+    # when there is nothing to compare against. The parsed targets are reused
+    # when limits.csv is rewritten below, so the file is only read once.
+    roster_data = load_roster(roster)
+    if not roster_data:
+        console.print("[red]Error: roster.csv is empty or missing[/red]")
+        sys.exit(1)
+    roster_index = index_roster_by_mq_id(roster_data)
+
+    existing_limits = load_limits(limits)
+    if not existing_limits:
+        console.print(f"[yellow]No targets in {limits} - run 'refresh-limits-file' to create it[/yellow]")
+        return
+
+    # 2. Fetch current state from OpenRouter (source of truth)
     console.print("[cyan]Fetching current keys from OpenRouter...[/cyan]")
     openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
     console.print(f"Found {len(openrouter_keys)} keys")
 
-    # 2. Load roster for identity mapping
-    roster_data = load_roster(roster)
-
     # 3. Build mapping of email -> key
-    matched, orphaned = map_keys_to_roster(openrouter_keys, roster_data)
+    matched, orphaned = map_keys_to_roster(openrouter_keys, roster_data, roster_index)
     email_to_key = {email: key for key, email, info in matched}
 
-    # 4. Load desired changes from limits.csv
-    changes_to_apply = []
-    with open(limits) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            email = row["email"]
-            if email not in email_to_key:
-                console.print(
-                    f"[yellow]Warning: {email} in limits.csv but not found in OpenRouter - skipping[/yellow]"
-                )
-                continue
-
-            key = email_to_key[email]
-
-            target_limit = row.get("target_limit")
-            actual_limit = key.get("limit")
-
-            if target_limit == "unlimited":
-                target_limit = None
-            elif target_limit:
-                target_limit = float(target_limit)
-
-            if target_limit != actual_limit:
-                changes_to_apply.append(
-                    {
-                        "email": email,
-                        "key_hash": key["hash"],
-                        "key_name": key["name"],
-                        "change_type": "limit",
-                        "old_value": actual_limit,
-                        "new_value": target_limit,
-                    }
-                )
-
-            target_disabled = row.get("target_disabled", "false").lower() == "true"
-            actual_disabled = key.get("disabled", False)
-
-            if target_disabled != actual_disabled:
-                changes_to_apply.append(
-                    {
-                        "email": email,
-                        "key_hash": key["hash"],
-                        "key_name": key["name"],
-                        "change_type": "disabled",
-                        "old_value": actual_disabled,
-                        "new_value": target_disabled,
-                    }
-                )
+    # 4. Work out which targets differ from OpenRouter
+    for email in existing_limits:
+        if email not in email_to_key:
+            console.print(
+                f"[yellow]Warning: {email} in limits.csv but not found in OpenRouter - skipping[/yellow]"
+            )
+    changes_to_apply = list(iter_changes(existing_limits, email_to_key))
 
     if not changes_to_apply:
         console.print("\n[green]No changes needed - targets match actuals[/green]")
-        save_limits(openrouter_keys, roster_data, limits)
-        snapshot_file = export_snapshot(openrouter_keys, roster_data)
+        snapshot_file = write_state_files(matched, limits, existing_limits=existing_limits)
         console.print(f"Exported snapshot to {snapshot_file}")
         return
 
     # 5. Show planned changes
     console.print(f"\n[cyan]Planned changes ({len(changes_to_apply)}):[/cyan]")
+    lines = []
     for change in changes_to_apply:
-        if change["change_type"] == "limit":
-            old = f"${change['old_value']}" if change["old_value"] else "unlimited"
-            new = f"${change['new_value']}" if change["new_value"] else "unlimited"
+        if change.change_type == "limit":
+            old = f"${change.old_value}" if change.old_value else "unlimited"
+            new = f"${change.new_value}" if change.new_value else "unlimited"
         else:
-            old = "disabled" if change["old_value"] else "enabled"
-            new = "disabled" if change["new_value"] else "enabled"
-        console.print(f"  {change['key_name']}: {change['change_type']} {old} -> {new}")
+            old = "disabled" if change.old_value else "enabled"
+            new = "disabled" if change.new_value else "enabled"
+        lines.append(f"  {change.key_name}: {change.change_type} {old} -> {new}")
+    console.print("\n".join(lines))
 
     if dry_run:
         console.print("\n[yellow]--dry-run specified, no changes applied[/yellow]")
         return
 
-    # 6. Apply changes
+    # 6. Apply changes. A changelog row is collected for each successful API
+    # call and all rows are written in one transaction afterwards -- including
+    # when a failure halts the run, so the audit trail stays accurate.
     console.print("\n[cyan]Applying changes...[/cyan]")
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
-    timestamp = datetime.now().isoformat()
+    now = datetime.now()
+    timestamp = now.isoformat()
+    changelog_rows = []
 
     with Progress(
         SpinnerColumn(),
@@ -934,65 +1481,70 @@ def update(ctx, limits, roster, db, dry_run):
             "[cyan]Updating keys...[/cyan]", total=len(changes_to_apply)
         )
 
-        for change in changes_to_apply:
-            progress.update(
-                task, description=f"Updating [yellow]{change['key_name']}[/yellow]"
-            )
-
-            try:
-                if change["change_type"] == "limit":
-                    update_openrouter_key(
-                        ctx.obj["api_key"],
-                        change["key_hash"],
-                        limit=change["new_value"],
-                    )
-                else:
-                    update_openrouter_key(
-                        ctx.obj["api_key"],
-                        change["key_hash"],
-                        disabled=change["new_value"],
-                    )
-
-                c.execute(
-                    """INSERT INTO changelog
-                            (key_hash, action, old_value, new_value, changed_at)
-                            VALUES (?, ?, ?, ?, ?)""",
-                    (
-                        change["key_hash"],
-                        f"update_{change['change_type']}",
-                        str(change["old_value"]),
-                        str(change["new_value"]),
-                        timestamp,
-                    ),
-                )
+        limiter = RateLimiter(API_RATE_LIMIT)
 
-                progress.advance(task)
-                time.sleep(1)
+        def apply(change):
+            # change_type is "limit" or "disabled", the matching keyword argument
+            return limiter.call(
+                update_openrouter_key,
+                ctx.obj["api_key"],
+                change.key_hash,
+                limiter=limiter,
+                **{change.change_type: change.new_value},
+            )
 
-            except Exception as e:
-                console.print(f"\n[red]Error updating {change['key_name']}: {e}[/red]")
-                console.print(
-                    "[yellow]Update halted. Changes applied so far have been preserved.[/yellow]"
+        def updated(change):
+            progress.update(task, description=f"Updated [yellow]{change.key_name}[/yellow]")
+            progress.advance(task)
+
+        # Updates already in flight when one fails (or on Ctrl-C) still
+        # complete and are logged below.
+        applied, failure = run_api_calls(apply, changes_to_apply, on_done=updated)
+
+        # Log in planned order regardless of completion order, and fold each
+        # update into the in-memory key: the changed field as OpenRouter
+        # reports it when the response has a body, else the value sent. Only
+        # that field is taken: a key's limit and disabled PATCHes run
+        # concurrently, so either body may still show the other's old value.
+        for index in sorted(applied):
+            change = changes_to_apply[index]
+            reported = applied[index].get("data") or {}
+            email_to_key[change.email][change.change_type] = reported.get(change.change_type, change.new_value)
+            changelog_rows.append(
+                (
+                    change.key_hash,
+                    f"update_{change.change_type}",
+                    str(change.old_value),
+                    str(change.new_value),
+                    timestamp,
                 )
-                conn.commit()
-                conn.close()
-                sys.exit(1)
+            )
 
-    conn.commit()
+    # 7. Update the database: the changelog and, unless the run halted, the
+    # new key state are committed together. `matched` holds the same key
+    # dicts the updates were folded into, so it already reflects the new state.
+    conn = connect_db(db)
+    with transaction(conn):
+        conn.executemany(INSERT_CHANGELOG_SQL, changelog_rows)
+        if failure is None:
+            update_database(conn, matched, timestamp)
     conn.close()
 
-    # 7. Fetch fresh state and update all files
-    console.print("\n[cyan]Fetching updated state from OpenRouter...[/cyan]")
-    openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
+    if failure is not None:
+        index, e = failure
+        if index is None:
+            console.print("\n[red]Interrupted[/red]")
+        else:
+            console.print(f"\n[red]Error updating {changes_to_apply[index].key_name}: {e}[/red]")
+        console.print(
+            "[yellow]Update halted. Changes applied so far have been preserved.[/yellow]"
+        )
+        sys.exit(1)
 
-    conn = sqlite3.connect(db)
-    update_database(conn, openrouter_keys, roster_data)
-    conn.close()
+    # 8. Save limits.csv and export snapshot
 
-    save_limits(openrouter_keys, roster_data, limits)
+    snapshot_file = write_state_files(matched, limits, existing_limits=existing_limits, now=now)
     console.print(f"\n[green]Updated {limits} with current state[/green]")
-
-    snapshot_file = export_snapshot(openrouter_keys, roster_data)
     console.print(f"[green]Exported snapshot to {snapshot_file}[/green]")
 
     console.print(
@@ -1007,40 +1559,35 @@ def update(ctx, limits, roster, db, dry_run):
 def refresh_limits_file(ctx, limits, roster):
     """Refresh limits.csv with current state from OpenRouter (preserves targets)"""
 
-    console.print("[cyan]Fetching current keys from OpenRouter...[/cyan]")
-    openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
-    console.print(f"Found {len(openrouter_keys)} keys")
-
+    # Roster first, so an empty or invalid roster fails before the network fetch
     roster_data = load_roster(roster)
     if not roster_data:
         console.print("[red]Error: roster.csv is empty or missing[/red]")
         sys.exit(1)
 
-    save_limits(openrouter_keys, roster_data, limits)
+    console.print("[cyan]Fetching current keys from OpenRouter...[/cyan]")
+    openrouter_keys = fetch_openrouter_keys(ctx.obj["api_key"])
+    console.print(f"Found {len(openrouter_keys)} keys")
 
     matched, orphaned = map_keys_to_roster(openrouter_keys, roster_data)
+    rows = save_limits(matched, limits)
 
     console.print(f"\n[green]Refreshed {limits}:[/green]")
     console.print(f"  Total keys: {len(openrouter_keys)}")
     console.print(f"  Matched to roster: {len(matched)}")
 
     mismatches = []
-    with open(limits) as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            if row["target_limit"] != row["actual_limit"]:
-                mismatches.append(
-                    f"  {row['name']}: limit target=${row['target_limit']} actual=${row['actual_limit']}"
-                )
-            if row["target_disabled"] != row["actual_disabled"]:
-                mismatches.append(
-                    f"  {row['name']}: disabled target={row['target_disabled']} actual={row['actual_disabled']}"
-                )
+    for row in rows:
+        if row["target_limit"] != row["actual_limit"]:
+            mismatches.append(f"  {row['name']}: limit target=${row['target_limit']} actual=${row['actual_limit']}")
+        if row["target_disabled"] != row["actual_disabled"]:
+            mismatches.append(
+                f"  {row['name']}: disabled target={row['target_disabled']} actual={row['actual_disabled']}"
+            )
 
     if mismatches:
         console.print("\n[yellow]Mismatches between target and actual:[/yellow]")
-        for mismatch in mismatches:
-            console.print(mismatch)
+        console.print("\n".join(mismatches))
         console.print(
             "\n[cyan]Run 'update' to apply target values to OpenRouter[/cyan]"
         )
@@ -1051,13 +1598,21 @@ def refresh_limits_file(ctx, limits, roster):
 @cli.command("export-keys")
 @click.option("--db", default="keys.db")
 @click.option(
-    "--output", default=None, help="Output filename (default: api_keys_TIMESTAMP.csv)"
+    "--output",
+    default=None,
+    help="Output filename (default: api_keys_TIMESTAMP.csv, .json for json and json-columns, .arrow for arrow)",
 )
 @click.option(
-    "--format", type=click.Choice(["csv", "json"]), default="csv", help="Output format"
+    "--format",
+    type=click.Choice(list(EXPORT_FORMATS)),
+    default="csv",
+    help="Output format (json-columns: one list per field instead of one object per key; "
+    "arrow: typed Feather v2 file, needs pyarrow)",
 )
+@click.option("--pretty", is_flag=True, help="Indent JSON output for reading")
+@click.option("--summary/--no-summary", default=True, help="Print a table of the exported keys")
 @click.pass_context
-def export_keys(ctx, db, output, format):
+def export_keys(ctx, db, output, format, pretty, summary):
     """
     **Export API keys** from database
 
@@ -1070,108 +1625,108 @@ def export_keys(ctx, db, output, format):
         console.print("[red]Error: Database not found. Run 'init-db' first[/red]")
         sys.exit(1)
 
-    conn = sqlite3.connect(db)
-    c = conn.cursor()
-
-    c.execute("""
-        SELECT k.key_hash, k.key_label, k.email, k.key_name, k.credit_limit, k.disabled,
-               s.first_name, s.last_name, s.mq_id
-        FROM key k
-        JOIN student s ON k.email = s.email
-        ORDER BY k.email
-    """)
-
-    keys = c.fetchall()
-    conn.close()
-
-    if not keys:
+    if format == "arrow":
+        # Imported here rather than at module level: pyarrow is optional and
+        # slow to import, and only this format needs it
+        try:
+            import pyarrow as pa
+            from pyarrow import feather
+        except ImportError:
+            raise click.ClickException("--format arrow requires pyarrow (uv pip install pyarrow)") from None
+
+    conn = connect_db(db, read_only=True)
+    total, stored = conn.execute(EXPORT_KEYS_COUNT_QUERY).fetchone()
+    if not total:
+        conn.close()
         console.print("[yellow]No keys found in database[/yellow]")
         return
 
     if output is None:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        output = f"api_keys_{timestamp}.{format}"
-
+        output = f"api_keys_{timestamp}.{EXPORT_FORMATS[format]}"
+
+    # Only the rows shown in the summary table (every row for small classes,
+    # else a preview) are held in memory.
+    if not summary:
+        preview_size = 0
+    elif total <= SUMMARY_MAX_ROWS:
+        preview_size = total
+    else:
+        preview_size = SUMMARY_PREVIEW_ROWS
+    cursor = conn.execute(EXPORT_KEYS_QUERY, {"missing_api_key": MISSING_API_KEY})
+    preview = list(islice(cursor, preview_size))
+    # The preview rows, then the rest straight from the cursor, so the writer
+    # consumes sqlite3's rows with no Python-level loop in between
+    rows = chain(preview, cursor)
+
+    # Every format is written through atomic_write: an export interrupted
+    # mid-write (Ctrl-C, full disk) leaves any earlier file at `output` as it
+    # was rather than a truncated list of keys. The panel and summary table
+    # are printed only once the file is in place.
     if format == "csv":
-        with open(output, "w", newline="") as f:
+        # writerows' per-row write() lands in the 1 MiB buffer, not a syscall;
+        # formatting into a StringIO and flushing 64 KiB chunks measured ~5%
+        # slower, as it adds a copy without saving any syscalls
+        with atomic_write(output, newline="", buffering=WRITE_BUFFER_SIZE) as f:
             writer = csv.writer(f)
-            writer.writerow(
-                [
-                    "first_name",
-                    "last_name",
-                    "email",
-                    "mq_id",
-                    "api_key",
-                    "key_name",
-                    "limit",
-                    "disabled",
-                ]
-            )
-
-            for (
-                _key_hash,
-                api_key,
-                email,
-                key_name,
-                credit_limit,
-                disabled,
-                first_name,
-                last_name,
-                mq_id,
-            ) in keys:
-                writer.writerow(
-                    [
-                        first_name,
-                        last_name,
-                        email,
-                        mq_id or "",
-                        api_key if api_key else "[Key not stored - check OpenRouter]",
-                        key_name,
-                        credit_limit if credit_limit else "unlimited",
-                        "true" if disabled else "false",
-                    ]
-                )
-
-    else:  # json
-        keys_data = []
-        for (
-            _key_hash,
-            api_key,
-            email,
-            key_name,
-            credit_limit,
-            disabled,
-            first_name,
-            last_name,
-            mq_id,
-        ) in keys:
-            keys_data.append(
-                {
-                    "first_name": first_name,
-                    "last_name": last_name,
-                    "email": email,
-                    "mq_id": mq_id or "",
-                    "api_key": api_key
-                    if api_key
-                    else "[Key not stored - check OpenRouter]",
-                    "key_name": key_name,
-                    "limit": credit_limit if credit_limit else "unlimited",
-                    "disabled": disabled,
-                }
-            )
-
-        with open(output, "w") as f:
-            json.dump(keys_data, f, indent=2)
+            writer.writerow(EXPORT_KEYS_FIELDS)
+            writer.writerows(rows)
+
+    else:  # json, json-columns, arrow
+        if format == "json":
+            # One object per key
+            entries = []
+            for row in rows:
+                entry = dict(zip(EXPORT_KEYS_FIELDS, row, strict=True))
+                entry["disabled"] = entry["disabled"] == "true"
+                entries.append(entry)
+        else:
+            # {field: [value per key]}: each field name is written once, not per key
+            columns = {field: [] for field in EXPORT_KEYS_FIELDS}
+            appends = [columns[field].append for field in EXPORT_KEYS_FIELDS]
+            for row in rows:
+                for append, value in zip(appends, row, strict=True):
+                    append(value)
+            columns["disabled"] = [value == "true" for value in columns["disabled"]]
+
+        if format == "arrow":
+            # Typed columns: limit is a float (null when unlimited), disabled a bool
+            columns["limit"] = [None if value == "unlimited" else value for value in columns["limit"]]
+            types = {"limit": pa.float64(), "disabled": pa.bool_()}
+            schema = pa.schema([(field, types.get(field, pa.string())) for field in EXPORT_KEYS_FIELDS])
+            with atomic_write(output, "wb") as f:
+                feather.write_feather(pa.table(columns, schema=schema), f, compression="zstd")
+        else:
+            # Encoded in one call and written as bytes; json.dump would issue a
+            # write() per encoder chunk
+            keys_data = entries if format == "json" else columns
+            if orjson:
+                payload = orjson.dumps(keys_data, option=orjson.OPT_INDENT_2 if pretty else None)
+            else:
+                # Same bytes orjson writes: UTF-8 rather than \u escapes, and
+                # no spaces after separators unless indenting
+                payload = json.dumps(
+                    keys_data,
+                    ensure_ascii=False,
+                    check_circular=False,
+                    indent=2 if pretty else None,
+                    separators=(",", ": ") if pretty else (",", ":"),
+                ).encode()
+            with atomic_write(output, "wb", buffering=WRITE_BUFFER_SIZE) as f:
+                f.write(payload)
+    conn.close()
 
     console.print(
         Panel.fit(
-            f"[bold green]Exported {len(keys)} keys to {output}[/bold green]\n\n"
+            f"[bold green]Exported {total} keys ({stored} with stored API keys) to {output}[/bold green]\n\n"
             f"[yellow]This file contains API keys - handle with care![/yellow]\n"
             f"[dim]Consider using secure distribution methods (encrypted email, secure file share)[/dim]",
             title="Keys Exported",
             border_style="green",
         )
     )
+    if not summary:
+        return
 
     table = Table(title="Exported Keys Summary", show_header=True)
     table.add_column("Email", style="cyan")
@@ -1180,21 +1735,12 @@ def export_keys(ctx, db, output, format):
     table.add_column("Key Name", style="dim")
     table.add_column("Has API Key?", justify="center")
 
-    for (
-        _key_hash,
-        api_key,
-        email,
-        key_name,
-        _credit_limit,
-        _disabled,
-        first_name,
-        last_name,
-        mq_id,
-    ) in keys:
-        has_key = "yes" if api_key else "no"
-        table.add_row(
-            email, f"{first_name} {last_name}", mq_id or "", key_name, has_key
-        )
+    # Large classes get a preview plus a totals row rather than one row per key
+    for first_name, last_name, email, mq_id, api_key, key_name, _limit, _disabled in preview:
+        has_key = "no" if api_key == MISSING_API_KEY else "yes"
+        table.add_row(email, f"{first_name} {last_name}", mq_id, key_name, has_key)
+    if len(preview) < total:
+        table.add_row("…", f"{total - len(preview)} more rows exported", "", "", f"{stored}/{total}")
 
     console.print(table)
 
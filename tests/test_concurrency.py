@@ -0,0 +1,119 @@
+"""Tests for RateLimiter and run_api_calls, which use real threads and timing."""
+
+import time
+
+import pytest
+
+from manage_keys import API_MAX_RETRIES, API_MAX_WORKERS, RateLimited, RateLimiter, run_api_calls
+
+# ── RateLimiter ──
+
+
+class TestRateLimiter:
+    def test_first_call_is_immediate(self):
+        limiter = RateLimiter(1.0)
+        start = time.monotonic()
+        limiter.wait()
+        assert time.monotonic() - start < 0.5
+
+    def test_spaces_consecutive_calls(self):
+        limiter = RateLimiter(50.0)
+        start = time.monotonic()
+        for _ in range(3):
+            limiter.wait()
+        assert time.monotonic() - start >= 0.04
+
+    def test_back_off_halves_rate_and_success_recovers(self):
+        limiter = RateLimiter(8.0, min_rate=1.0, increase=1.0)
+        limiter.back_off(0)
+        assert limiter.rate == pytest.approx(4.0)
+        limiter.back_off(0)
+        limiter.back_off(0)
+        limiter.back_off(0)
+        assert limiter.rate == pytest.approx(1.0)
+        for _ in range(20):
+            limiter.succeeded()
+        assert limiter.rate == pytest.approx(8.0)
+
+    def test_call_retries_after_rate_limit(self):
+        limiter = RateLimiter(1000.0)
+        attempts = []
+
+        def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise RateLimited("slow down", retry_after=0.01)
+            return "ok"
+
+        assert limiter.call(flaky) == "ok"
+        assert len(attempts) == 3
+
+    def test_call_gives_up_after_max_retries(self):
+        limiter = RateLimiter(1000.0)
+        attempts = []
+
+        def always_limited():
+            attempts.append(1)
+            raise RateLimited("slow down", retry_after=0)
+
+        with pytest.raises(RateLimited):
+            limiter.call(always_limited)
+        assert len(attempts) == API_MAX_RETRIES + 1
+
+
+# ── run_api_calls ──
+
+
+class TestRunApiCalls:
+    def test_results_keyed_by_index(self):
+        done = []
+        results, failure = run_api_calls(lambda x: x * 2, [1, 2, 3], on_done=done.append)
+        assert results == {0: 2, 1: 4, 2: 6}
+        assert failure is None
+        assert sorted(done) == [1, 2, 3]
+
+    def test_reports_first_failure(self):
+        def fn(x):
+            if x == "bad":
+                raise ValueError(x)
+            return x
+
+        results, failure = run_api_calls(fn, ["ok", "bad"])
+        index, error = failure
+        assert index == 1
+        assert isinstance(error, ValueError)
+        assert 1 not in results
+
+    def test_failure_stops_starting_calls(self):
+        started = []
+
+        def fn(x):
+            started.append(x)
+            if x == 0:
+                raise ValueError(x)
+            time.sleep(0.01)
+            return x
+
+        results, failure = run_api_calls(fn, list(range(40)))
+        assert failure[0] == 0
+        assert len(started) <= API_MAX_WORKERS + 1
+        assert set(results) == set(started) - {0}
+
+    def test_interrupt_stops_starting_calls_and_keeps_results(self):
+        started = []
+
+        def fn(x):
+            started.append(x)
+            time.sleep(0.01)
+            return x
+
+        def interrupt(x):
+            raise KeyboardInterrupt
+
+        results, failure = run_api_calls(fn, list(range(40)), on_done=interrupt)
+        index, error = failure
+        assert index is None
+        assert isinstance(error, KeyboardInterrupt)
+        assert len(started) < 40
+        # Every call that ran has its result, including those still in flight
+        assert sorted(results) == sorted(started)
@@ -5,7 +5,16 @@ import sqlite3
 import pytest
 from click.testing import CliRunner
 
-from manage_keys import SCHEMA_VERSION, cli, update_database
+from manage_keys import (
+    EXPORT_KEYS_QUERY,
+    LATEST_USAGE_QUERY,
+    SCHEMA_VERSION,
+    cli,
+    connect_db,
+    map_keys_to_roster,
+    transaction,
+    update_database,
+)
 
 
 @pytest.fixture()
@@ -87,6 +96,66 @@ class TestInitDb:
         assert result.exit_code != 0
         assert "outdated" in result.output
 
+    def test_creates_indexes(self, initialized_db):
+        conn = sqlite3.connect(initialized_db)
+        c = conn.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%'")
+        indexes = {row[0] for row in c.fetchall()}
+        conn.close()
+        assert indexes == {"idx_key_email", "idx_usage_key_hash_checked", "idx_changelog_key_hash"}
+
+    def test_export_query_uses_email_index(self, initialized_db):
+        """export-keys reads key rows in index order, with no temp sort."""
+        conn = sqlite3.connect(initialized_db)
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {EXPORT_KEYS_QUERY}", {"missing_api_key": ""})]
+        conn.close()
+        assert any("idx_key_email" in step for step in plan)
+        assert not any("TEMP B-TREE" in step for step in plan)
+
+    def test_changelog_history_uses_index(self, initialized_db):
+        """Per-key changelog history is an index range scan, newest first, with no sort."""
+        conn = sqlite3.connect(initialized_db)
+        query = "SELECT * FROM changelog WHERE key_hash = ? ORDER BY changed_at DESC"
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {query}", ("abc123",))]
+        conn.close()
+        assert any("idx_changelog_key_hash" in step for step in plan)
+        assert not any("TEMP B-TREE" in step for step in plan)
+
+    def test_latest_usage_query_uses_index(self, initialized_db):
+        """Latest usage per key comes from the usage index alone, never a table scan."""
+        conn = sqlite3.connect(initialized_db)
+        plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {LATEST_USAGE_QUERY}")]
+        conn.close()
+        assert all("idx_usage_key_hash_checked" in step for step in plan if step.startswith(("SCAN", "SEARCH")))
+
+    def test_migrates_v2_schema(self, initialized_db, runner, monkeypatch):
+        """A v2 database (no indexes) is upgraded in place, keeping its data."""
+        monkeypatch.setenv("OPENROUTER_PROVISIONING_KEY", "test-key")
+        conn = sqlite3.connect(initialized_db)
+        for name in ("idx_key_email", "idx_usage_key_hash_checked", "idx_changelog_key_hash"):
+            conn.execute(f"DROP INDEX {name}")
+        conn.execute("UPDATE schema_version SET version = 2")
+        conn.execute(
+            "INSERT INTO student (email, first_name, last_name, mq_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            ("a@example.com", "A", "B", "12345", "2026-01-01"),
+        )
+        conn.commit()
+        conn.close()
+
+        result = runner.invoke(cli, ["init-db", "--db", initialized_db])
+        assert result.exit_code == 0
+        assert "migrated" in result.output
+
+        conn = sqlite3.connect(initialized_db)
+        c = conn.cursor()
+        c.execute("SELECT version FROM schema_version")
+        assert c.fetchone()[0] == SCHEMA_VERSION
+        c.execute("SELECT count(*) FROM sqlite_master WHERE type='index' AND name LIKE 'idx_%'")
+        assert c.fetchone()[0] == 3
+        c.execute("SELECT count(*) FROM student")
+        assert c.fetchone()[0] == 1
+        conn.close()
+
     def test_rejects_outdated_schema_version(self, db_path, runner, monkeypatch):
         """A database with old schema version is rejected."""
         monkeypatch.setenv("OPENROUTER_PROVISIONING_KEY", "test-key")
@@ -101,6 +170,49 @@ class TestInitDb:
         assert "outdated" in result.output
 
 
+class TestConnectDb:
+    def test_enables_wal(self, initialized_db):
+        conn = connect_db(initialized_db)
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        conn.close()
+
+    def test_sets_cache_size(self, initialized_db):
+        conn = connect_db(initialized_db)
+        assert conn.execute("PRAGMA cache_size").fetchone()[0] == -65536
+        conn.close()
+
+    def test_read_only_rejects_writes(self, initialized_db):
+        conn = connect_db(initialized_db, read_only=True)
+        assert conn.execute("SELECT version FROM schema_version").fetchone() == (SCHEMA_VERSION,)
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("DELETE FROM schema_version")
+        conn.close()
+
+    def test_read_only_does_not_create_missing_file(self, tmp_path):
+        with pytest.raises(sqlite3.OperationalError):
+            connect_db(tmp_path / "missing.db", read_only=True)
+        assert not (tmp_path / "missing.db").exists()
+
+
+class TestTransaction:
+    def test_rolls_back_on_error(self, initialized_db):
+        conn = connect_db(initialized_db)
+        with pytest.raises(RuntimeError), transaction(conn):
+            conn.execute("INSERT INTO changelog (key_hash, action, changed_at) VALUES ('h', 'a', 'now')")
+            raise RuntimeError("boom")
+        assert conn.execute("SELECT count(*) FROM changelog").fetchone()[0] == 0
+        conn.close()
+
+    def test_nested_block_joins_outer_transaction(self, initialized_db):
+        conn = connect_db(initialized_db)
+        with pytest.raises(RuntimeError), transaction(conn):
+            with transaction(conn):
+                conn.execute("INSERT INTO changelog (key_hash, action, changed_at) VALUES ('h', 'a', 'now')")
+            raise RuntimeError("boom")
+        assert conn.execute("SELECT count(*) FROM changelog").fetchone()[0] == 0
+        conn.close()
+
+
 class TestUpdateDatabase:
     def test_inserts_student_and_key(self, initialized_db):
         conn = sqlite3.connect(initialized_db)
@@ -124,7 +236,7 @@ class TestUpdateDatabase:
                 "created_at": "2026-02-27T00:00:00",
             }
         ]
-        update_database(conn, keys, roster)
+        update_database(conn, map_keys_to_roster(keys, roster)[0])
 
         c = conn.cursor()
         c.execute("SELECT first_name, last_name, mq_id FROM student WHERE email = ?", ("yuki@example.com",))
@@ -152,22 +264,101 @@ class TestUpdateDatabase:
             }
         }
         keys = [{"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0}]
-        update_database(conn, keys, roster)
+        update_database(conn, map_keys_to_roster(keys, roster)[0])
 
         # Update the name
         roster["yuki@example.com"]["first_name"] = "YUKI"
-        update_database(conn, keys, roster)
+        update_database(conn, map_keys_to_roster(keys, roster)[0])
 
         c = conn.cursor()
         c.execute("SELECT first_name FROM student WHERE email = ?", ("yuki@example.com",))
         assert c.fetchone()[0] == "YUKI"
         conn.close()
 
+    def test_key_upsert_preserves_created_at(self, initialized_db):
+        """ON CONFLICT(key_hash) DO UPDATE should update limits but keep created_at."""
+        conn = sqlite3.connect(initialized_db)
+        roster = {"yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"}}
+        key = {"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0, "limit": 3.0}
+        update_database(conn, map_keys_to_roster([{**key, "created_at": "2026-02-27T00:00:00"}], roster)[0])
+        update_database(conn, map_keys_to_roster([{**key, "limit": 5.0}], roster)[0])
+
+        c = conn.cursor()
+        c.execute("SELECT created_at, credit_limit FROM key WHERE key_hash = ?", ("abc123",))
+        assert c.fetchone() == ("2026-02-27T00:00:00", 5.0)
+        conn.close()
+
+    def test_unchanged_state_writes_no_rows(self, initialized_db):
+        conn = sqlite3.connect(initialized_db)
+        roster = {"yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"}}
+        keys = [{"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0.5, "limit": None}]
+        update_database(conn, map_keys_to_roster(keys, roster)[0])
+        before = conn.total_changes
+        update_database(conn, map_keys_to_roster(keys, roster)[0])
+        assert conn.total_changes == before
+        conn.close()
+
+    def test_student_with_several_keys(self, initialized_db):
+        conn = sqlite3.connect(initialized_db)
+        roster = {"yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"}}
+        keys = [
+            {"name": "20260101_Yuki Aoki_48385123", "hash": "old123", "usage": 2.0},
+            {"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0.5},
+        ]
+        update_database(conn, map_keys_to_roster(keys, roster)[0])
+        assert conn.execute("SELECT count(*) FROM student").fetchone()[0] == 1
+        assert conn.execute(
+            "SELECT key_hash FROM key WHERE email = 'yuki@example.com' ORDER BY key_hash"
+        ).fetchall() == [
+            ("abc123",),
+            ("old123",),
+        ]
+        conn.close()
+
+    def test_usage_recorded_only_when_changed(self, initialized_db):
+        conn = sqlite3.connect(initialized_db)
+        roster = {"yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"}}
+        key = {"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0.5}
+        update_database(conn, map_keys_to_roster([key], roster)[0])
+        update_database(conn, map_keys_to_roster([key], roster)[0])
+        update_database(conn, map_keys_to_roster([{**key, "usage": 0.75}], roster)[0])
+
+        c = conn.cursor()
+        c.execute("SELECT usage FROM usage WHERE key_hash = ? ORDER BY id", ("abc123",))
+        assert [row[0] for row in c.fetchall()] == [0.5, 0.75]
+        conn.close()
+
+    def test_rows_use_given_timestamp(self, initialized_db):
+        conn = sqlite3.connect(initialized_db)
+        roster = {"yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"}}
+        keys = [{"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0.5}]
+        update_database(conn, map_keys_to_roster(keys, roster)[0], "2026-03-01T09:00:00")
+
+        c = conn.cursor()
+        c.execute("SELECT checked_at FROM usage WHERE key_hash = ?", ("abc123",))
+        assert c.fetchone()[0] == "2026-03-01T09:00:00"
+        c.execute("SELECT created_at FROM student WHERE email = ?", ("yuki@example.com",))
+        assert c.fetchone()[0] == "2026-03-01T09:00:00"
+        conn.close()
+
+    def test_joins_callers_transaction(self, initialized_db):
+        """Inside an outer transaction (as provision uses it), a rollback undoes every write."""
+        conn = connect_db(initialized_db)
+        roster = {"yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"}}
+        keys = [{"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0.5}]
+        with pytest.raises(RuntimeError), transaction(conn):
+            update_database(conn, map_keys_to_roster(keys, roster)[0])
+            raise RuntimeError("boom")
+
+        for table in ("student", "key", "usage"):
+            assert conn.execute(f"SELECT count(*) FROM {table}").fetchone()[0] == 0  # noqa: S608
+        conn.close()
+
     def test_unmatched_keys_are_not_inserted(self, initialized_db):
         """Keys not matched to roster should not create student records."""
         conn = sqlite3.connect(initialized_db)
         keys = [{"name": "20260227_Unknown_99999999", "hash": "xyz789", "usage": 0}]
-        update_database(conn, keys, {})
+        update_database(conn, map_keys_to_roster(keys, {})[0])
 
         c = conn.cursor()
         c.execute("SELECT count(*) FROM student")
@@ -175,3 +366,22 @@ class TestUpdateDatabase:
         c.execute("SELECT count(*) FROM key")
         assert c.fetchone()[0] == 0
         conn.close()
+
+    def test_failed_write_rolls_back(self, initialized_db):
+        """A failing insert leaves no partial student/key rows behind."""
+        conn = sqlite3.connect(initialized_db)
+        roster = {
+            "yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"},
+            "aki@example.com": {"first_name": None, "last_name": "Sato", "mq_id": "48385124"},
+        }
+        keys = [
+            {"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0},
+            {"name": "20260227_Aki Sato_48385124", "hash": "def456", "usage": 0},
+        ]
+        with pytest.raises(sqlite3.IntegrityError):
+            update_database(conn, map_keys_to_roster(keys, roster)[0])
+
+        c = conn.cursor()
+        c.execute("SELECT count(*) FROM student")
+        assert c.fetchone()[0] == 0
+        conn.close()
@@ -0,0 +1,158 @@
+"""Tests for the export-keys command."""
+
+import csv
+import json
+import sys
+
+import pytest
+from click.testing import CliRunner
+
+import manage_keys
+from manage_keys import MISSING_API_KEY, cli, connect_db, map_keys_to_roster, update_database
+
+
+@pytest.fixture()
+def populated_db(tmp_path, monkeypatch):
+    """Database holding two keys: one with a stored API key and limit, one without either."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENROUTER_PROVISIONING_KEY", "test-key")
+    assert CliRunner().invoke(cli, ["init-db"]).exit_code == 0
+    roster = {
+        "yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"},
+        "dasol.kim@example.com": {"first_name": "Dasol", "last_name": "Kim", "mq_id": "60853379"},
+    }
+    keys = [
+        {"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "label": "sk-or-v1-abc", "limit": 3.0},
+        {"name": "20260227_Dasol Kim_60853379", "hash": "def456", "limit": None, "disabled": True},
+    ]
+    matched, _ = map_keys_to_roster(keys, roster)
+    conn = connect_db("keys.db")
+    update_database(conn, matched)
+    conn.close()
+    return tmp_path
+
+
+def test_csv_export(populated_db):
+    result = CliRunner().invoke(cli, ["export-keys", "--output", "out.csv"])
+    assert result.exit_code == 0, result.output
+    with open(populated_db / "out.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [row["email"] for row in rows] == ["dasol.kim@example.com", "yuki@example.com"]
+    assert rows[0]["api_key"] == MISSING_API_KEY
+    assert rows[0]["limit"] == "unlimited"
+    assert rows[0]["disabled"] == "true"
+    assert rows[1]["api_key"] == "sk-or-v1-abc"
+    assert rows[1]["limit"] == "3.0"
+
+
+@pytest.mark.parametrize("pretty", [False, True])
+def test_json_export(populated_db, pretty):
+    args = ["export-keys", "--format", "json", "--output", "out.json"] + (["--pretty"] if pretty else [])
+    result = CliRunner().invoke(cli, args)
+    assert result.exit_code == 0, result.output
+    text = (populated_db / "out.json").read_text()
+    assert ("\n" in text) == pretty
+    entries = json.loads(text)
+    assert [entry["disabled"] for entry in entries] == [True, False]
+    assert entries[1]["first_name"] == "Yuki"
+
+
+def test_json_export_without_orjson_matches_orjson_bytes(populated_db, monkeypatch):
+    """The stdlib fallback writes compact UTF-8, as orjson does, not \\u escapes."""
+    monkeypatch.setattr(manage_keys, "orjson", None)
+    conn = connect_db("keys.db")
+    conn.execute("UPDATE student SET first_name = 'Zoë' WHERE email = 'yuki@example.com'")
+    conn.close()
+    result = CliRunner().invoke(cli, ["export-keys", "--format", "json", "--output", "out.json"])
+    assert result.exit_code == 0, result.output
+    raw = (populated_db / "out.json").read_bytes()
+    assert '"first_name":"Zoë"'.encode() in raw
+    assert b", " not in raw and b": " not in raw
+
+
+def test_json_columns_export(populated_db):
+    result = CliRunner().invoke(cli, ["export-keys", "--format", "json-columns"])
+    assert result.exit_code == 0, result.output
+    (output,) = populated_db.glob("api_keys_*.json")
+    columns = json.loads(output.read_text())
+    assert list(columns) == ["first_name", "last_name", "email", "mq_id", "api_key", "key_name", "limit", "disabled"]
+    assert columns["email"] == ["dasol.kim@example.com", "yuki@example.com"]
+    assert columns["disabled"] == [True, False]
+    assert columns["limit"] == ["unlimited", 3.0]
+
+
+def test_arrow_export(populated_db):
+    feather = pytest.importorskip("pyarrow.feather")
+    result = CliRunner().invoke(cli, ["export-keys", "--format", "arrow"])
+    assert result.exit_code == 0, result.output
+    (output,) = populated_db.glob("api_keys_*.arrow")
+    table = feather.read_table(str(output))
+    assert table.column_names == [
+        "first_name",
+        "last_name",
+        "email",
+        "mq_id",
+        "api_key",
+        "key_name",
+        "limit",
+        "disabled",
+    ]
+    assert table.column("limit").to_pylist() == [None, 3.0]
+    assert table.column("disabled").to_pylist() == [True, False]
+
+
+def test_arrow_export_without_pyarrow(populated_db, monkeypatch):
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    result = CliRunner().invoke(cli, ["export-keys", "--format", "arrow"])
+    assert result.exit_code == 1
+    assert "requires pyarrow" in result.output
+    assert not list(populated_db.glob("api_keys_*"))
+
+
+def test_export_does_not_read_roster(populated_db):
+    """Names come from the student table; a stale or missing roster.csv is irrelevant."""
+    (populated_db / "roster.csv").write_text("not,a,roster\n")
+    result = CliRunner().invoke(cli, ["export-keys", "--output", "out.csv"])
+    assert result.exit_code == 0, result.output
+    with open(populated_db / "out.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["first_name"], row["last_name"]) for row in rows] == [("Dasol", "Kim"), ("Yuki", "Aoki")]
+
+
+def test_large_export_summarises_totals(populated_db, monkeypatch):
+    monkeypatch.setattr(manage_keys, "SUMMARY_MAX_ROWS", 1)
+    monkeypatch.setattr(manage_keys, "SUMMARY_PREVIEW_ROWS", 1)
+    result = CliRunner(env={"COLUMNS": "200"}).invoke(cli, ["export-keys", "--output", "out.csv"])
+    assert result.exit_code == 0, result.output
+    assert "1 more rows exported" in result.output
+    assert "1/2" in result.output
+    with open(populated_db / "out.csv", newline="") as f:
+        assert len(list(csv.DictReader(f))) == 2
+
+
+def test_no_summary_skips_table(populated_db):
+    result = CliRunner(env={"COLUMNS": "200"}).invoke(cli, ["export-keys", "--output", "out.csv", "--no-summary"])
+    assert result.exit_code == 0, result.output
+    assert "Exported 2 keys (1 with stored API keys)" in result.output
+    assert "Exported Keys Summary" not in result.output
+
+
+def test_interrupted_export_keeps_previous_file(populated_db, monkeypatch):
+    (populated_db / "out.csv").write_text("previous export\n")
+
+    class InterruptedWriter:
+        def __init__(self, f):
+            self.f = f
+
+        def writerow(self, row):
+            self.f.write(",".join(row) + "\n")
+
+        def writerows(self, rows):
+            raise KeyboardInterrupt
+
+    monkeypatch.setattr(manage_keys.csv, "writer", InterruptedWriter)
+    result = CliRunner().invoke(cli, ["export-keys", "--output", "out.csv"])
+    assert result.exit_code != 0
+    assert "Keys Exported" not in result.output
+    assert (populated_db / "out.csv").read_text() == "previous export\n"
+    assert not (populated_db / "out.csv.tmp").exists()
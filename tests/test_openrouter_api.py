@@ -0,0 +1,147 @@
+"""Tests for the OpenRouter HTTP helpers, with the shared session stubbed out."""
+
+import json
+
+import pytest
+
+import manage_keys
+from manage_keys import KEYS_PAGE_SIZE, RateLimited, RateLimiter, create_openrouter_key, fetch_openrouter_keys
+
+
+class FakeResponse:
+    def __init__(self, data, status_code=200, headers=None):
+        self.status_code = status_code
+        self._data = data
+        self.headers = headers or {}
+
+    @property
+    def content(self):
+        return json.dumps({"data": self._data}).encode()
+
+    def json(self):
+        return {"data": self._data}
+
+
+class FakeSession:
+    """Serves `total` keys in KEYS_PAGE_SIZE pages and records requested offsets."""
+
+    def __init__(self, total):
+        self.keys = [{"name": f"key{i}", "hash": f"h{i}"} for i in range(total)]
+        self.offsets = []
+
+    def get(self, url, headers=None, params=None, timeout=None):
+        offset = (params or {}).get("offset", 0)
+        self.offsets.append(offset)
+        return FakeResponse(self.keys[offset : offset + KEYS_PAGE_SIZE])
+
+
+@pytest.fixture()
+def fake_session(monkeypatch):
+    def install(total):
+        session = FakeSession(total)
+        monkeypatch.setattr(manage_keys, "_SESSION", session)
+        return session
+
+    return install
+
+
+class TestFetchOpenrouterKeys:
+    def test_single_page_is_one_request(self, fake_session):
+        session = fake_session(3)
+        keys = fetch_openrouter_keys("test-key")
+        assert [k["hash"] for k in keys] == ["h0", "h1", "h2"]
+        assert session.offsets == [0]
+
+    def test_follows_pages(self, fake_session):
+        session = fake_session(KEYS_PAGE_SIZE * 2 + 5)
+        keys = fetch_openrouter_keys("test-key")
+        assert len(keys) == KEYS_PAGE_SIZE * 2 + 5
+        assert len({k["hash"] for k in keys}) == len(keys)
+        assert session.offsets == [0, KEYS_PAGE_SIZE, KEYS_PAGE_SIZE * 2]
+
+    def test_exact_page_multiple_stops_on_empty_page(self, fake_session):
+        session = fake_session(KEYS_PAGE_SIZE)
+        assert len(fetch_openrouter_keys("test-key")) == KEYS_PAGE_SIZE
+        assert session.offsets == [0, KEYS_PAGE_SIZE]
+
+    def test_stops_when_offset_is_ignored(self, monkeypatch):
+        class IgnoresOffset(FakeSession):
+            def get(self, url, headers=None, params=None, timeout=None):
+                self.offsets.append((params or {}).get("offset", 0))
+                return FakeResponse(self.keys)
+
+        session = IgnoresOffset(KEYS_PAGE_SIZE)
+        monkeypatch.setattr(manage_keys, "_SESSION", session)
+        assert len(fetch_openrouter_keys("test-key")) == KEYS_PAGE_SIZE
+        assert session.offsets == [0, KEYS_PAGE_SIZE]
+
+    def test_error_status_raises(self, monkeypatch):
+        class ErrorSession:
+            def get(self, *args, **kwargs):
+                return FakeResponse(None, status_code=401)
+
+        monkeypatch.setattr(manage_keys, "_SESSION", ErrorSession())
+        with pytest.raises(manage_keys.click.ClickException, match="401"):
+            fetch_openrouter_keys("test-key")
+
+
+class TestCreateOpenrouterKey:
+    @pytest.fixture()
+    def respond(self, monkeypatch):
+        def install(response):
+            class PostSession:
+                def post(self, *args, **kwargs):
+                    return response
+
+            monkeypatch.setattr(manage_keys, "_SESSION", PostSession())
+
+        return install
+
+    def test_rate_limit_carries_retry_after(self, respond):
+        respond(FakeResponse(None, status_code=429, headers={"Retry-After": "7"}))
+        with pytest.raises(RateLimited) as excinfo:
+            create_openrouter_key("test-key", "20260227_Yuki Aoki_48385123")
+        assert excinfo.value.retry_after == 7.0
+
+    def test_rate_limit_without_usable_retry_after(self, respond):
+        respond(FakeResponse(None, status_code=429, headers={"Retry-After": "Wed, 21 Oct 2026 07:28:00 GMT"}))
+        with pytest.raises(RateLimited) as excinfo:
+            create_openrouter_key("test-key", "20260227_Yuki Aoki_48385123")
+        assert excinfo.value.retry_after == 1.0
+
+    def test_sends_json_payload_and_decodes_response(self, monkeypatch):
+        sent = {}
+
+        class PostSession:
+            def post(self, url, data, headers, timeout=None):
+                sent.update(json.loads(data), content_type=headers["Content-Type"])
+                return FakeResponse({"hash": "abc123"}, status_code=201)
+
+        monkeypatch.setattr(manage_keys, "_SESSION", PostSession())
+        result = create_openrouter_key("test-key", "20260227_Yuki Aoki_48385123", limit=3.0, limit_reset="weekly")
+        assert result == {"data": {"hash": "abc123"}}
+        assert sent == {
+            "name": "20260227_Yuki Aoki_48385123",
+            "limit": 3.0,
+            "limit_reset": "weekly",
+            "content_type": "application/json",
+        }
+
+    def test_other_errors_are_not_rate_limits(self, respond):
+        respond(FakeResponse(None, status_code=500))
+        with pytest.raises(manage_keys.click.ClickException, match="500") as excinfo:
+            create_openrouter_key("test-key", "20260227_Yuki Aoki_48385123")
+        assert not isinstance(excinfo.value, RateLimited)
+
+    def test_low_remaining_budget_holds_limiter(self, respond):
+        limiter = RateLimiter(100.0)
+        respond(FakeResponse({}, status_code=201, headers={"X-RateLimit-Remaining": "1", "Retry-After": "5"}))
+        create_openrouter_key("test-key", "20260227_Yuki Aoki_48385123", limiter=limiter)
+        assert limiter._next_slot - manage_keys.time.monotonic() > 4
+        assert limiter.rate == 100.0
+
+    def test_ample_remaining_budget_does_not_hold(self, respond):
+        limiter = RateLimiter(100.0)
+        respond(FakeResponse({}, status_code=201, headers={"X-RateLimit-Remaining": "50", "Retry-After": "5"}))
+        create_openrouter_key("test-key", "20260227_Yuki Aoki_48385123", limiter=limiter)
+        assert limiter._next_slot <= manage_keys.time.monotonic()
@@ -0,0 +1,80 @@
+"""Tests for the provision command, with OpenRouter calls stubbed out."""
+
+import csv
+
+import pytest
+from click.testing import CliRunner
+
+import manage_keys
+from manage_keys import cli
+
+ROSTER = (
+    "first_name,last_name,email,mq_id,budget,limit_reset\n"
+    "Ana,Bell,ana@example.com,10000001,3,weekly\n"
+    "Bo,Chen,bo@example.com,10000002,3,weekly\n"
+    "Cy,Diaz,cy@example.com,10000003,3,weekly\n"
+)
+
+
+@pytest.fixture()
+def workdir(tmp_path, monkeypatch):
+    """Initialized database and roster in a temp cwd; Bo already has a key."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENROUTER_PROVISIONING_KEY", "test-key")
+    assert CliRunner().invoke(cli, ["init-db"]).exit_code == 0
+    (tmp_path / "roster.csv").write_text(ROSTER)
+    existing = {"name": "20260101_Bo Chen_10000002", "hash": "h-bo", "limit": 3.0, "usage": 0.0, "disabled": False}
+    monkeypatch.setattr(manage_keys, "fetch_openrouter_keys", lambda api_key: [dict(existing)])
+    return tmp_path
+
+
+def test_created_keys_merge_with_existing(workdir, monkeypatch):
+    def create(api_key, name, limit=None, limit_reset=None, limiter=None):
+        key_hash = f"h-{name.split('_')[1].split()[0].lower()}"
+        data = {"name": name, "hash": key_hash, "label": "sk-or-" + key_hash, "limit": limit, "disabled": False}
+        return {"data": data, "key": "sk-or-" + key_hash}
+
+    monkeypatch.setattr(manage_keys, "create_openrouter_key", create)
+    result = CliRunner().invoke(cli, ["provision"])
+    assert result.exit_code == 0, result.output
+
+    with open(workdir / "limits.csv", newline="") as f:
+        rows = list(csv.DictReader(f))
+    assert [(row["email"], row["hash"]) for row in rows] == [
+        ("ana@example.com", "h-ana"),
+        ("bo@example.com", "h-bo"),
+        ("cy@example.com", "h-cy"),
+    ]
+    (keys_file,) = workdir.glob("api_keys_*.csv")
+    with open(keys_file, newline="") as f:
+        assert [row["email"] for row in csv.DictReader(f)] == ["ana@example.com", "cy@example.com"]
+
+
+def test_empty_roster_exits_before_fetch(workdir, monkeypatch):
+    (workdir / "roster.csv").write_text(ROSTER.splitlines(keepends=True)[0])
+
+    def no_fetch(api_key):
+        raise AssertionError("OpenRouter should not be contacted")
+
+    monkeypatch.setattr(manage_keys, "fetch_openrouter_keys", no_fetch)
+    result = CliRunner().invoke(cli, ["provision"])
+    assert result.exit_code == 1
+    assert "roster.csv is empty" in result.output
+
+
+def test_failure_saves_keys_created_so_far(workdir, monkeypatch):
+    def create(api_key, name, limit=None, limit_reset=None, limiter=None):
+        if "Cy Diaz" in name:
+            raise manage_keys.click.ClickException("Error creating key: 500")
+        return {"data": {"name": name, "hash": "h-ana", "limit": limit, "disabled": False}, "key": "sk-or-h-ana"}
+
+    monkeypatch.setattr(manage_keys, "create_openrouter_key", create)
+    result = CliRunner().invoke(cli, ["provision"])
+    assert result.exit_code == 1
+    assert "Provisioning halted" in result.output
+
+    (keys_file,) = workdir.glob("api_keys_*.csv")
+    with open(keys_file, newline="") as f:
+        assert [(row["email"], row["api_key"]) for row in csv.DictReader(f)] == [("ana@example.com", "sk-or-h-ana")]
+    with open(workdir / "limits.csv", newline="") as f:
+        assert [row["email"] for row in csv.DictReader(f)] == ["ana@example.com", "bo@example.com"]
@@ -4,8 +4,13 @@ import pytest
 from click import ClickException
 
 from manage_keys import (
+    Change,
     build_key_name,
     display_name,
+    extract_mq_id,
+    index_roster_by_mq_id,
+    iter_changes,
+    limits_equal,
     map_keys_to_roster,
     parse_key_name,
     validate_roster_row,
@@ -34,6 +39,10 @@ class TestDisplayName:
     def test_multi_word_names(self):
         assert display_name({"first_name": "Maira Camila", "last_name": "Nagles Tapia"}) == "Maira Camila Nagles Tapia"
 
+    def test_uses_precomputed_name(self):
+        info = {"first_name": "Yuki", "last_name": "Aoki", "_display_name": "Yuki Aoki (cached)"}
+        assert display_name(info) == "Yuki Aoki (cached)"
+
 
 # ── parse_key_name ──
 
@@ -57,6 +66,14 @@ class TestParseKeyName:
         assert name == "Some Name"
         assert mq_id is None
 
+    def test_underscores_in_name(self):
+        """The MQ ID is the segment after the last underscore."""
+        assert parse_key_name("20260227_Ann_Lee_48385123") == ("20260227", "Ann_Lee", "48385123")
+
+    def test_newline_in_name_is_not_a_key_name(self):
+        """Matches the regex, whose "." never spans a newline."""
+        assert parse_key_name("20260227_Yuki\nAoki_48385123") == (None, "20260227_Yuki\nAoki_48385123", None)
+
     def test_no_date_prefix(self):
         date, name, mq_id = parse_key_name("random_key_name")
         assert date is None
@@ -79,6 +96,28 @@ class TestParseKeyName:
         assert mq_id == "48385123"
 
 
+# ── extract_mq_id ──
+
+
+class TestExtractMqId:
+    @pytest.mark.parametrize(
+        "key_name",
+        [
+            "20260227_Chaeyeon Kim_60853425",
+            "20260227_Maira Camila Nagles Tapia_48388939",
+            "20260227_Some Name",
+            "20260227_Kim",
+            "random_key_name",
+            "abcdefgh_Name_12345",
+            "20260227__12345",
+            "20260227_Name_12 345",
+            "",
+        ],
+    )
+    def test_agrees_with_parse_key_name(self, key_name):
+        assert extract_mq_id(key_name) == parse_key_name(key_name)[2]
+
+
 # ── build_key_name ──
 
 
@@ -202,6 +241,28 @@ class TestMapKeysToRoster:
         assert len(matched) == 0
         assert len(orphaned) == 1
 
+    def test_matches_after_rename(self, roster):
+        """Matching is a lookup on the MQ ID alone; the name in the key may be stale."""
+        keys = [{"name": "20250101_Chae-yeon Kim-Park_60853425", "hash": "abc123"}]
+        matched, orphaned = map_keys_to_roster(keys, roster)
+        assert [m[1] for m in matched] == ["chaeyeon.kim@example.com"]
+        assert orphaned == []
+
+    def test_matched_sorted_by_email(self, roster):
+        keys = [
+            {"name": "20260227_Dasol Kim_60853379", "hash": "def456"},
+            {"name": "20260227_Chaeyeon Kim_60853425", "hash": "abc123"},
+        ]
+        matched, _ = map_keys_to_roster(keys, roster)
+        assert [m[1] for m in matched] == ["chaeyeon.kim@example.com", "dasol.kim@example.com"]
+
+    def test_prebuilt_index_matches_default(self, roster):
+        keys = [
+            {"name": "20260227_Chaeyeon Kim_60853425", "hash": "abc123"},
+            {"name": "20260227_Unknown Person_99999999", "hash": "xyz789"},
+        ]
+        assert map_keys_to_roster(keys, roster, index_roster_by_mq_id(roster)) == map_keys_to_roster(keys, roster)
+
     def test_empty_keys(self, roster):
         matched, orphaned = map_keys_to_roster([], roster)
         assert len(matched) == 0
@@ -215,3 +276,61 @@ class TestMapKeysToRoster:
         matched, orphaned = map_keys_to_roster(keys, roster)
         assert len(matched) == 1
         assert len(orphaned) == 1
+
+
+# ── limits_equal ──
+
+
+class TestLimitsEqual:
+    @pytest.mark.parametrize(
+        "a, b, expected",
+        [
+            (5.0, 5.0, True),
+            (5.0, 5.000001 - 1e-9, True),
+            (5.0, 5, True),
+            (5.0, 5.01, False),
+            (None, None, True),
+            (None, 0.0, False),
+            (3.0, None, False),
+        ],
+    )
+    def test_compares_limits(self, a, b, expected):
+        assert limits_equal(a, b) is expected
+
+
+# ── iter_changes ──
+
+
+class TestIterChanges:
+    @pytest.fixture()
+    def email_to_key(self):
+        return {
+            "yuki@example.com": {
+                "name": "20260227_Yuki Aoki_48385123",
+                "hash": "abc123",
+                "limit": 3.0,
+                "disabled": False,
+            }
+        }
+
+    def test_no_changes_when_targets_match(self, email_to_key):
+        limits = {"yuki@example.com": {"target_limit": "3.0", "target_disabled": "false"}}
+        assert list(iter_changes(limits, email_to_key)) == []
+
+    def test_limit_and_disabled_changes(self, email_to_key):
+        limits = {"yuki@example.com": {"target_limit": "unlimited", "target_disabled": "true"}}
+        assert list(iter_changes(limits, email_to_key)) == [
+            Change("yuki@example.com", "abc123", "20260227_Yuki Aoki_48385123", "limit", 3.0, None),
+            Change("yuki@example.com", "abc123", "20260227_Yuki Aoki_48385123", "disabled", False, True),
+        ]
+
+    @pytest.mark.parametrize("spelling", ["true", "tRue", " true", "TRUE\t", "1", " Yes "])
+    def test_disabled_target_ignores_case_and_whitespace(self, email_to_key, spelling):
+        limits = {"yuki@example.com": {"target_limit": "3.0", "target_disabled": spelling}}
+        assert list(iter_changes(limits, email_to_key)) == [
+            Change("yuki@example.com", "abc123", "20260227_Yuki Aoki_48385123", "disabled", False, True),
+        ]
+
+    def test_unknown_email_is_skipped(self, email_to_key):
+        limits = {"someone@example.com": {"target_limit": "5.0", "target_disabled": "true"}}
+        assert list(iter_changes(limits, email_to_key)) == []
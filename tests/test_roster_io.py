@@ -1,9 +1,11 @@
 """Tests for roster CSV loading and saving."""
 
+import csv
+
 import pytest
 from click import ClickException
 
-from manage_keys import load_roster, save_roster
+from manage_keys import _iter_csv_columns, load_limits, load_roster, save_roster
 
 
 @pytest.fixture()
@@ -64,6 +66,18 @@ class TestLoadRoster:
         roster = load_roster(str(tmp_path / "missing.csv"))
         assert roster == {}
 
+    def test_error_reports_file_line_after_blank_lines(self, tmp_path):
+        p = tmp_path / "roster.csv"
+        p.write_text(
+            "first_name,last_name,email,mq_id,budget,limit_reset\n"
+            "Yuki,Aoki,yuki@example.com,48385123,3,weekly\n"
+            "\n"
+            "\n"
+            ",Kim,dasol.kim@example.com,60853379,5,monthly\n"
+        )
+        with pytest.raises(ClickException, match="row 5"):
+            load_roster(str(p))
+
     def test_strips_whitespace(self, tmp_path):
         p = tmp_path / "roster.csv"
         p.write_text(
@@ -76,6 +90,53 @@ class TestLoadRoster:
         assert roster["yuki@example.com"]["mq_id"] == "48385123"
         assert roster["yuki@example.com"]["limit_reset"] == "weekly"
 
+    def test_columns_in_any_order(self, tmp_path):
+        p = tmp_path / "roster.csv"
+        p.write_text(
+            "email,mq_id,last_name,first_name,limit_reset,budget\nyuki@example.com,48385123,Aoki,Yuki,daily,2\n"
+        )
+        roster = load_roster(str(p))
+        assert roster["yuki@example.com"] == {
+            "first_name": "Yuki",
+            "last_name": "Aoki",
+            "mq_id": "48385123",
+            "budget": 2.0,
+            "limit_reset": "daily",
+            "_display_name": "Yuki Aoki",
+        }
+
+    def test_optional_columns_may_be_absent(self, tmp_path):
+        p = tmp_path / "roster.csv"
+        p.write_text("first_name,last_name,email,mq_id\nYuki,Aoki,yuki@example.com,48385123\n")
+        roster = load_roster(str(p))
+        assert roster["yuki@example.com"]["budget"] is None
+        assert roster["yuki@example.com"]["limit_reset"] is None
+
+    def test_blank_lines_are_skipped(self, valid_roster_csv):
+        with open(valid_roster_csv, "a") as f:
+            f.write("\n\n")
+        assert len(load_roster(valid_roster_csv)) == 2
+
+
+class TestLoadLimits:
+    def test_loads_targets_by_email(self, tmp_path):
+        p = tmp_path / "limits.csv"
+        p.write_text(
+            "email,name,mq_id,target_limit,actual_limit,target_disabled,actual_disabled,key_name,hash\n"
+            "yuki@example.com,Yuki Aoki,48385123,5.0,3.0,true,false,20260227_Yuki Aoki_48385123,abc123\n"
+        )
+        limits = load_limits(str(p))
+        assert limits == {"yuki@example.com": {"target_limit": "5.0", "target_disabled": "true"}}
+
+    def test_nonexistent_file_returns_empty(self, tmp_path):
+        assert load_limits(str(tmp_path / "missing.csv")) == {}
+
+    def test_quoted_field_with_newline(self, tmp_path):
+        p = tmp_path / "limits.csv"
+        p.write_bytes(b'email,name,target_limit,target_disabled\r\nyuki@example.com,"Yuki\r\nAoki",5.0,false\r\n')
+        limits = load_limits(str(p))
+        assert limits == {"yuki@example.com": {"target_limit": "5.0", "target_disabled": "false"}}
+
 
 class TestSaveRoster:
     def test_roundtrip(self, tmp_path):
@@ -112,6 +173,23 @@ class TestSaveRoster:
         assert loaded["yuki@example.com"]["budget"] is None
         assert loaded["yuki@example.com"]["limit_reset"] is None
 
+    def test_header_and_column_order(self, tmp_path):
+        roster = {
+            "yuki@example.com": {
+                "first_name": "Yuki",
+                "last_name": "Aoki",
+                "mq_id": "48385123",
+                "budget": 3.0,
+                "limit_reset": "weekly",
+            },
+        }
+        path = tmp_path / "out.csv"
+        save_roster(roster, str(path))
+        assert path.read_text().splitlines() == [
+            "first_name,last_name,email,mq_id,budget,limit_reset",
+            "Yuki,Aoki,yuki@example.com,48385123,3.0,weekly",
+        ]
+
     def test_output_is_sorted_by_email(self, tmp_path):
         roster = {
             "zz@example.com": {"first_name": "Z", "last_name": "Z", "mq_id": "2", "budget": 3.0, "limit_reset": None},
@@ -121,3 +199,13 @@ class TestSaveRoster:
         save_roster(roster, path)
         content = (tmp_path / "out.csv").read_text()
         assert content.index("aa@example.com") < content.index("zz@example.com")
+
+
+class TestIterCsvColumns:
+    def test_single_column_yields_tuples(self):
+        reader = csv.reader(["email,name", "a@example.com,A", "", "b@example.com"])
+        assert list(_iter_csv_columns(reader, ["email"])) == [("a@example.com",), ("b@example.com",)]
+
+    def test_absent_column_and_short_row_are_missing(self):
+        reader = csv.reader(["email,name", "a@example.com"])
+        assert list(_iter_csv_columns(reader, ["name", "mq_id"], missing="")) == [("", "")]
@@ -0,0 +1,126 @@
+"""Tests for limits.csv and snapshot CSV generation."""
+
+import csv
+from datetime import datetime
+
+import pytest
+
+from manage_keys import atomic_write, export_snapshot, map_keys_to_roster, save_limits, write_state_files
+
+
+@pytest.fixture()
+def matched():
+    roster = {
+        "yuki@example.com": {"first_name": "Yuki", "last_name": "Aoki", "mq_id": "48385123"},
+        "dasol.kim@example.com": {"first_name": "Dasol", "last_name": "Kim", "mq_id": "60853379"},
+    }
+    keys = [
+        {
+            "name": "20260227_Dasol Kim_60853379",
+            "hash": "def456",
+            "usage": 1.25,
+            "limit": None,
+            "limit_reset": None,
+            "disabled": True,
+        },
+        {
+            "name": "20260227_Yuki Aoki_48385123",
+            "hash": "abc123",
+            "usage": 0.5,
+            "limit": 3.0,
+            "limit_reset": "weekly",
+            "disabled": False,
+        },
+    ]
+    matched, _ = map_keys_to_roster(keys, roster)
+    matched.sort(key=lambda m: m[1])
+    return matched
+
+
+def read_rows(path):
+    with open(path) as f:
+        return list(csv.DictReader(f))
+
+
+class TestSaveLimits:
+    def test_targets_default_to_actuals(self, tmp_path, matched):
+        path = tmp_path / "limits.csv"
+        save_limits(matched, str(path))
+        rows = read_rows(path)
+        assert [row["email"] for row in rows] == ["dasol.kim@example.com", "yuki@example.com"]
+        assert rows[0]["target_limit"] == rows[0]["actual_limit"] == "unlimited"
+        assert rows[0]["target_disabled"] == rows[0]["actual_disabled"] == "true"
+        assert rows[1]["target_limit"] == rows[1]["actual_limit"] == "3.0"
+
+    def test_returns_rows_written(self, tmp_path, matched):
+        path = tmp_path / "limits.csv"
+        rows = save_limits(matched, str(path))
+        assert [{k: str(v) for k, v in row.items()} for row in rows] == read_rows(path)
+
+    def test_preserves_existing_targets(self, tmp_path, matched):
+        path = tmp_path / "limits.csv"
+        save_limits(matched, str(path))
+        rows = read_rows(path)
+        rows[1]["target_limit"] = "7.5"
+        rows[1]["target_disabled"] = "true"
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+
+        save_limits(matched, str(path))
+        row = read_rows(path)[1]
+        assert row["target_limit"] == "7.5"
+        assert row["actual_limit"] == "3.0"
+        assert row["target_disabled"] == "true"
+        assert row["actual_disabled"] == "false"
+
+    @pytest.mark.parametrize("spelling", ["TRUE", "1", "yes", "tRue", " true", "Yes "])
+    def test_accepts_truthy_target_disabled(self, tmp_path, matched, spelling):
+        path = tmp_path / "limits.csv"
+        save_limits(matched, str(path))
+        rows = read_rows(path)
+        rows[1]["target_disabled"] = spelling
+        with open(path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=rows[0].keys())
+            writer.writeheader()
+            writer.writerows(rows)
+
+        save_limits(matched, str(path))
+        assert read_rows(path)[1]["target_disabled"] == "true"
+
+
+class TestWriteStateFiles:
+    def test_matches_separate_writers(self, tmp_path, matched, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        save_limits(matched, "separate_limits.csv")
+        separate_snapshot = export_snapshot(matched, prefix="separate")
+
+        fused_snapshot = write_state_files(matched, "fused_limits.csv", prefix="fused")
+
+        assert read_rows("fused_limits.csv") == read_rows("separate_limits.csv")
+        assert read_rows(fused_snapshot) == read_rows(separate_snapshot)
+
+    def test_snapshot_stamped_with_given_time(self, tmp_path, matched, monkeypatch):
+        monkeypatch.chdir(tmp_path)
+        now = datetime(2026, 2, 27, 9, 30, 0)
+        assert write_state_files(matched, now=now) == "snapshot_20260227_093000.csv"
+
+
+class TestAtomicWrite:
+    def test_replaces_file_on_success(self, tmp_path):
+        path = tmp_path / "limits.csv"
+        path.write_text("old\n")
+        with atomic_write(str(path)) as f:
+            f.write("new\n")
+        assert path.read_text() == "new\n"
+        assert list(tmp_path.iterdir()) == [path]
+
+    def test_failure_keeps_old_file(self, tmp_path):
+        path = tmp_path / "limits.csv"
+        path.write_text("old\n")
+        with pytest.raises(RuntimeError), atomic_write(str(path), fsync=True) as f:
+            f.write("partial")
+            raise RuntimeError("disk full")
+        assert path.read_text() == "old\n"
+        assert list(tmp_path.iterdir()) == [path]
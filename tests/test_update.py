@@ -0,0 +1,147 @@
+"""Tests for the update command, with OpenRouter calls stubbed out."""
+
+import json
+from types import SimpleNamespace
+
+import pytest
+from click.testing import CliRunner
+
+import manage_keys
+from manage_keys import cli
+
+ROSTER_HEADER = "first_name,last_name,email,mq_id,budget,limit_reset\n"
+LIMITS_HEADER = "email,name,mq_id,target_limit,actual_limit,target_disabled,actual_disabled,key_name,hash\n"
+
+
+@pytest.fixture()
+def workdir(tmp_path, monkeypatch):
+    """Initialized database in a temp cwd, with OpenRouter fetches forbidden."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("OPENROUTER_PROVISIONING_KEY", "test-key")
+    assert CliRunner().invoke(cli, ["init-db"]).exit_code == 0
+
+    def no_fetch(api_key):
+        raise AssertionError("OpenRouter should not be contacted")
+
+    monkeypatch.setattr(manage_keys, "fetch_openrouter_keys", no_fetch)
+    return tmp_path
+
+
+def test_empty_roster_exits_before_fetch(workdir):
+    (workdir / "roster.csv").write_text(ROSTER_HEADER)
+    (workdir / "limits.csv").write_text(LIMITS_HEADER)
+    result = CliRunner().invoke(cli, ["update"])
+    assert result.exit_code == 1
+    assert "roster.csv is empty" in result.output
+
+
+def test_empty_limits_returns_before_fetch(workdir):
+    (workdir / "roster.csv").write_text(ROSTER_HEADER + "Yuki,Aoki,yuki@example.com,48385123,3,weekly\n")
+    (workdir / "limits.csv").write_text(LIMITS_HEADER)
+    result = CliRunner().invoke(cli, ["update"])
+    assert result.exit_code == 0
+    assert "refresh-limits-file" in result.output
+    assert (workdir / "limits.csv").read_text() == LIMITS_HEADER
+
+
+def test_applies_changes_without_refetching(workdir, monkeypatch):
+    (workdir / "roster.csv").write_text(ROSTER_HEADER + "Yuki,Aoki,yuki@example.com,48385123,3,weekly\n")
+    (workdir / "limits.csv").write_text(
+        LIMITS_HEADER + "yuki@example.com,Yuki Aoki,48385123,5.0,3.0,true,false,20260227_Yuki Aoki_48385123,abc123\n"
+    )
+    key = {"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0.5, "limit": 3.0, "disabled": False}
+    fetches = []
+    monkeypatch.setattr(manage_keys, "fetch_openrouter_keys", lambda api_key: fetches.append(1) or [dict(key)])
+    # A PATCH answered with 204 No Content
+    monkeypatch.setattr(manage_keys, "update_openrouter_key", lambda *args, **kwargs: {})
+
+    result = CliRunner().invoke(cli, ["update"])
+    assert result.exit_code == 0, result.output
+    assert len(fetches) == 1
+    row = (workdir / "limits.csv").read_text().splitlines()[1].split(",")
+    assert row[3:7] == ["5.0", "5.0", "true", "true"]
+
+    conn = manage_keys.connect_db("keys.db")
+    assert conn.execute("SELECT credit_limit, disabled FROM key WHERE key_hash = 'abc123'").fetchone() == (5.0, 1)
+    actions = conn.execute("SELECT action, new_value FROM changelog ORDER BY id").fetchall()
+    conn.close()
+    assert actions == [("update_limit", "5.0"), ("update_disabled", "True")]
+
+
+def test_stale_response_does_not_revert_other_change(workdir, monkeypatch):
+    """The disabled PATCH may answer before the limit PATCH lands, echoing the old limit."""
+    (workdir / "roster.csv").write_text(ROSTER_HEADER + "Yuki,Aoki,yuki@example.com,48385123,3,weekly\n")
+    (workdir / "limits.csv").write_text(
+        LIMITS_HEADER + "yuki@example.com,Yuki Aoki,48385123,5.0,3.0,true,false,20260227_Yuki Aoki_48385123,abc123\n"
+    )
+    key = {"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0.5, "limit": 3.0, "disabled": False}
+    monkeypatch.setattr(manage_keys, "fetch_openrouter_keys", lambda api_key: [dict(key)])
+
+    def stale_update(api_key, key_hash, limit=None, disabled=None, limiter=None):
+        return {"data": dict(key, limit=limit if limit is not None else 3.0, disabled=bool(disabled))}
+
+    monkeypatch.setattr(manage_keys, "update_openrouter_key", stale_update)
+    result = CliRunner().invoke(cli, ["update"])
+    assert result.exit_code == 0, result.output
+    row = (workdir / "limits.csv").read_text().splitlines()[1].split(",")
+    assert row[3:7] == ["5.0", "5.0", "true", "true"]
+
+    conn = manage_keys.connect_db("keys.db")
+    assert conn.execute("SELECT credit_limit, disabled FROM key WHERE key_hash = 'abc123'").fetchone() == (5.0, 1)
+    conn.close()
+
+
+class PatchSession:
+    """Answers each PATCH with the key as `apply` leaves it, recording the payloads sent."""
+
+    def __init__(self, key, apply=dict.update):
+        self.key = key
+        self.apply = apply
+        self.sent = []
+
+    def patch(self, url, data, headers, timeout=None):
+        payload = json.loads(data)
+        self.sent.append(payload)
+        self.apply(self.key, payload)
+        return SimpleNamespace(status_code=200, headers={}, content=json.dumps({"data": self.key}).encode())
+
+
+@pytest.fixture()
+def unlimited_target(workdir, monkeypatch):
+    """A key limited to 3.0 whose limits.csv target is unlimited."""
+    (workdir / "roster.csv").write_text(ROSTER_HEADER + "Yuki,Aoki,yuki@example.com,48385123,3,weekly\n")
+    (workdir / "limits.csv").write_text(
+        LIMITS_HEADER
+        + "yuki@example.com,Yuki Aoki,48385123,unlimited,3.0,false,false,20260227_Yuki Aoki_48385123,abc123\n"
+    )
+    key = {"name": "20260227_Yuki Aoki_48385123", "hash": "abc123", "usage": 0.5, "limit": 3.0, "disabled": False}
+    monkeypatch.setattr(manage_keys, "fetch_openrouter_keys", lambda api_key: [dict(key)])
+    return key
+
+
+def test_unlimited_target_sends_null_limit(workdir, monkeypatch, unlimited_target):
+    session = PatchSession(dict(unlimited_target))
+    monkeypatch.setattr(manage_keys, "_SESSION", session)
+    result = CliRunner().invoke(cli, ["update"])
+    assert result.exit_code == 0, result.output
+    assert session.sent == [{"limit": None}]
+    row = (workdir / "limits.csv").read_text().splitlines()[1].split(",")
+    assert row[3:5] == ["unlimited", "unlimited"]
+
+    conn = manage_keys.connect_db("keys.db")
+    assert conn.execute("SELECT credit_limit FROM key WHERE key_hash = 'abc123'").fetchone() == (None,)
+    conn.close()
+
+
+def test_records_limit_reported_by_openrouter(workdir, monkeypatch, unlimited_target):
+    """A PATCH the server does not act on leaves the old limit recorded as actual."""
+    session = PatchSession(dict(unlimited_target), apply=lambda key, payload: None)
+    monkeypatch.setattr(manage_keys, "_SESSION", session)
+    result = CliRunner().invoke(cli, ["update"])
+    assert result.exit_code == 0, result.output
+    row = (workdir / "limits.csv").read_text().splitlines()[1].split(",")
+    assert row[3:5] == ["unlimited", "3.0"]
+
+    conn = manage_keys.connect_db("keys.db")
+    assert conn.execute("SELECT credit_limit FROM key WHERE key_hash = 'abc123'").fetchone() == (3.0,)
+    conn.close()